@@ -0,0 +1,254 @@
+# Developer: Eric Neftali Paiz
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from datetime import datetime
+from file_lock import FileLock
+from instrumentation import span
+from storage_janitor import data_dir, notify_access, notify_write
+
+# Every upload lives under data/store/<first two hex chars>/<sha256>/ together with
+# everything derived from it (extracted text, summaries, audio), so a PDF that was
+# already processed is served straight from disk no matter what it was called.
+# Each object keeps its names and artifact list in its own OBJECT_INFO file, so
+# recording an artifact rewrites a few hundred bytes rather than an index of
+# every upload, and evicting the object removes its metadata with it.
+STORE_DIR = data_dir("data/store")
+OBJECT_INFO = "object.json"
+# Serializes metadata updates between the app, batch_cli and job workers.
+METADATA_LOCK_PATH = os.path.join(STORE_DIR, "metadata.lock")
+# Single index of all objects written before per-object metadata; still read for
+# objects that have no OBJECT_INFO yet.
+LEGACY_MANIFEST_PATH = os.path.join(STORE_DIR, "manifest.json")
+SOURCE_ARTIFACT = "source.pdf"
+TEXT_ARTIFACT = "text.txt"
+SUMMARY_ARTIFACT = "summary.txt"
+# Summary, sentiment and notes from OllamaIntegration.analyze_document, as JSON.
+ANALYSIS_ARTIFACT = "analysis.json"
+# Byte offsets of every page in TEXT_ARTIFACT, so a page range is read without
+# loading the whole text (see text_extraction.load_pages).
+PAGE_INDEX_ARTIFACT = "pages.json"
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def object_dir(digest):
+    return os.path.join(STORE_DIR, digest[:2], digest)
+
+
+def artifact_path(digest, name):
+    return os.path.join(object_dir(digest), name)
+
+
+def artifact_name(kind, *parts, ext="mp3"):
+    """
+    Builds a filesystem-safe artifact name such as "speech-rachel.mp3".
+
+    Args:
+        kind (str): What the artifact is, e.g. "speech" or "summary_audio".
+        parts: Values that distinguish variants of the same kind (voice, settings).
+        ext (str): File extension.
+
+    Returns:
+        str: The artifact file name.
+    """
+    slug = "-".join(re.sub(r"[^A-Za-z0-9_.]+", "_", str(part)) for part in parts)
+    return f"{kind}-{slug}.{ext}" if slug else f"{kind}.{ext}"
+
+
+def page_range_label(pages):
+    """Returns e.g. "pages_3-10" for the 0-based, end-exclusive range (2, 10)."""
+    start, stop = pages
+    return f"pages_{start + 1}-{stop}"
+
+
+def summary_artifact(pages=None):
+    """
+    Names the summary of a whole document (pages=None) or of a page range.
+
+    Args:
+        pages: Optional (start, stop) page range, 0-based and end-exclusive.
+
+    Returns:
+        str: The artifact name.
+    """
+    if pages is None:
+        return SUMMARY_ARTIFACT
+    return artifact_name("summary", page_range_label(pages), ext="txt")
+
+
+def _write_atomic(path, data):
+    # Text is stored as its exact UTF-8 bytes (no newline translation on Windows),
+    # so byte offsets computed from the string, e.g. in the page index, stay valid.
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+### Metadata ###
+def _load_legacy_manifest():
+    if os.path.exists(LEGACY_MANIFEST_PATH):
+        with open(LEGACY_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def load_object_info(digest):
+    """
+    Returns what is recorded about a stored upload.
+
+    Returns:
+        dict | None: "names" (names it was uploaded under), "created" and
+            "artifacts" (artifact names saved for it), or None if unknown.
+    """
+    try:
+        with open(artifact_path(digest, OBJECT_INFO), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return _load_legacy_manifest().get(digest)
+
+
+def _record(digest, original_name=None, artifact=None):
+    path = artifact_path(digest, OBJECT_INFO)
+    with FileLock(METADATA_LOCK_PATH):
+        info = load_object_info(digest) or {
+            "names": [],
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "artifacts": [],
+        }
+        if original_name and original_name not in info["names"]:
+            info["names"].append(original_name)
+        if artifact and artifact not in info["artifacts"]:
+            info["artifacts"].append(artifact)
+        _write_atomic(path, json.dumps(info, ensure_ascii=False, indent=4))
+    notify_write(path)
+
+
+### Objects ###
+def store_bytes(data, original_name=None):
+    """
+    Stores raw upload bytes under their SHA-256 digest.
+
+    Args:
+        data (bytes): The uploaded file content.
+        original_name (str): Optional name the file was uploaded under.
+
+    Returns:
+        str: The hex digest identifying the stored object.
+    """
+    digest = hash_bytes(data)
+    source_path = artifact_path(digest, SOURCE_ARTIFACT)
+    if not os.path.exists(source_path):
+        os.makedirs(object_dir(digest), exist_ok=True)
+        _write_atomic(source_path, data)
+        notify_write(source_path)
+        _record(digest, original_name, SOURCE_ARTIFACT)
+    elif original_name and original_name not in (load_object_info(digest) or {}).get("names", []):
+        _record(digest, original_name)
+    return digest
+
+
+def store_uploaded_file(uploaded_file):
+    return store_bytes(uploaded_file.getvalue(), uploaded_file.name)
+
+
+def has_artifact(digest, name):
+    path = artifact_path(digest, name)
+    if os.path.exists(path):
+        notify_access(path)
+        return True
+    return False
+
+
+def load_artifact(digest, name, binary=False):
+    """
+    Reads a derived artifact for a stored upload.
+
+    Returns:
+        str | bytes | None: The artifact content, or None if it was never produced.
+    """
+    path = artifact_path(digest, name)
+    if not os.path.exists(path):
+        return None
+    notify_access(path)
+    with span("file.read", artifact=name) as current:
+        if binary:
+            with open(path, "rb") as f:
+                data = f.read()
+        else:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                data = f.read()
+        current.set_tag(size=len(data))
+        return data
+
+
+def read_artifact_range(digest, name, start, stop):
+    """
+    Reads bytes [start, stop) of an artifact without reading the rest of it.
+
+    Returns:
+        bytes | None: The bytes, or None if the artifact was never produced.
+    """
+    path = artifact_path(digest, name)
+    if not os.path.exists(path):
+        return None
+    notify_access(path)
+    with span("file.read", artifact=name, size=stop - start), open(path, "rb") as f:
+        f.seek(start)
+        return f.read(stop - start)
+
+
+def save_artifact_file(digest, name, source_path):
+    """
+    Moves a finished file (e.g. spooled audio) into the store as an artifact,
+    without reading it into memory.
+
+    Returns:
+        str: Path to the saved artifact.
+    """
+    os.makedirs(object_dir(digest), exist_ok=True)
+    path = artifact_path(digest, name)
+    with span("file.write", artifact=name, move=True):
+        shutil.move(source_path, path)
+    notify_write(path)
+    _record(digest, artifact=name)
+    return path
+
+
+def save_artifact(digest, name, data):
+    """
+    Saves a derived artifact next to its source upload and records it in its metadata.
+
+    Args:
+        digest (str): Digest returned by store_bytes.
+        name (str): Artifact file name, e.g. TEXT_ARTIFACT or artifact_name(...).
+        data (str | bytes): Artifact content.
+
+    Returns:
+        str: Path to the saved artifact.
+    """
+    os.makedirs(object_dir(digest), exist_ok=True)
+    path = artifact_path(digest, name)
+    with span("file.write", artifact=name, size=len(data)):
+        _write_atomic(path, data)
+    notify_write(path)
+    _record(digest, artifact=name)
+    return path
+
+
+def forget_object(digest):
+    """
+    Drops a stored upload from the legacy manifest after its directory was removed
+    (e.g. evicted by the storage janitor). Per-object metadata goes with the directory.
+    """
+    with FileLock(METADATA_LOCK_PATH):
+        manifest = _load_legacy_manifest()
+        if manifest.pop(digest, None) is not None:
+            _write_atomic(LEGACY_MANIFEST_PATH, json.dumps(manifest, ensure_ascii=False, indent=4))
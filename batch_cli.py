@@ -0,0 +1,239 @@
+# Developer: Eric Neftali Paiz
+"""
+Headless batch conversion of PDFs to extracted text, summaries and optional audio.
+
+Example:
+    python batch_cli.py "lectures/week*/*.pdf" --output out --workers 4 --tts --voice Rachel
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from dotenv import load_dotenv
+from artifact_store import (
+    ANALYSIS_ARTIFACT, SUMMARY_ARTIFACT, TEXT_ARTIFACT, artifact_name, artifact_path, has_artifact, load_artifact,
+    save_artifact, save_artifact_file, store_bytes,
+)
+from text_extraction import extract_stored_text, extract_to_store
+
+BRANDING_INTRO = "This audio is brought to you by ThoughtScribe, powered by ElevenLabs."
+
+
+def find_pdfs(inputs):
+    """
+    Expands directories (searched recursively) and glob patterns into a sorted,
+    de-duplicated list of PDF paths.
+    """
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.update(glob.glob(os.path.join(item, "**", "*.pdf"), recursive=True))
+        else:
+            paths.update(path for path in glob.glob(item, recursive=True) if path.lower().endswith(".pdf"))
+    return sorted(paths)
+
+
+def output_stems(pdf_paths):
+    """
+    Names each PDF's outputs after its path relative to the inputs' common parent
+    directory, so week1/lecture.pdf and week2/lecture.pdf do not overwrite each
+    other's results.
+
+    Returns:
+        dict: PDF path -> output path without extension, relative to --output.
+    """
+    absolute = {path: os.path.splitext(os.path.abspath(path))[0] for path in pdf_paths}
+    try:
+        base = os.path.commonpath([os.path.dirname(stem) for stem in absolute.values()])
+    except ValueError:
+        # Inputs on different drives share no parent; keep the drive as the first directory.
+        return {
+            path: os.path.join(drive.strip(":\\/") or "root", rest.lstrip("\\/"))
+            for path, (drive, rest) in ((path, os.path.splitdrive(stem)) for path, stem in absolute.items())
+        }
+    return {path: os.path.relpath(stem, base) for path, stem in absolute.items()}
+
+
+class _Timer:
+    def __init__(self, report, stage):
+        self.report = report
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.report["stages"][self.stage] = {
+            "seconds": round(time.perf_counter() - self.started, 4),
+            **self.report["stages"].get(self.stage, {}),
+        }
+
+
+def process_pdf(pdf_path, args, output_stem=None):
+    """
+    Runs one PDF through extraction, summarization and optional TTS, reusing
+    anything the artifact store already has unless --force is given.
+
+    Args:
+        pdf_path (str): The PDF to process.
+        args: Parsed command-line arguments.
+        output_stem (str): Output path without extension, relative to --output
+            (see output_stems). Defaults to the PDF's file name.
+
+    Returns:
+        dict: The per-file section of the run report.
+    """
+    report = {"file": pdf_path, "status": "ok", "stages": {}, "outputs": {}}
+    stem = os.path.join(args.output, output_stem or os.path.splitext(os.path.basename(pdf_path))[0])
+    try:
+        os.makedirs(os.path.dirname(stem), exist_ok=True)
+        with _Timer(report, "store"):
+            with open(pdf_path, "rb") as f:
+                digest = store_bytes(f.read(), os.path.basename(pdf_path))
+        report["digest"] = digest
+
+        report["stages"]["extract"] = {"cached": has_artifact(digest, TEXT_ARTIFACT) and not args.force}
+        with _Timer(report, "extract"):
+            if args.force:
+                text = extract_to_store(digest, workers=args.extraction_workers)
+            else:
+                text = extract_stored_text(digest, workers=args.extraction_workers)
+        report["text_chars"] = len(text)
+        text_output = f"{stem}.txt"
+        shutil.copyfile(artifact_path(digest, TEXT_ARTIFACT), text_output)
+        report["outputs"]["text"] = text_output
+
+        if not args.skip_summary:
+            cached = not args.force and has_artifact(digest, SUMMARY_ARTIFACT) and (
+                not args.analyze or has_artifact(digest, ANALYSIS_ARTIFACT)
+            )
+            report["stages"]["summarize"] = {"cached": cached}
+            with _Timer(report, "summarize"):
+                if not cached:
+                    from ollama_integration import ANALYSIS_FIELDS, OllamaIntegration
+                    ollama_client = OllamaIntegration(base_url=args.ollama_url)
+                    if args.analyze:
+                        # Summary, sentiment and notes from one pass over the text.
+                        analysis = ollama_client.analyze_document(text)
+                        summary = analysis["summary"]
+                        save_artifact(digest, ANALYSIS_ARTIFACT,
+                                      json.dumps({field: analysis[field] for field in ANALYSIS_FIELDS}, indent=4))
+                    else:
+                        from text_extraction import load_page_hashes, load_page_index, load_pages
+                        page_index = load_page_index(digest, workers=args.extraction_workers)
+                        summary = ollama_client.summarize_pages(
+                            load_pages(digest, 0, page_index["pages"], page_index),
+                            load_page_hashes(digest, 0, page_index["pages"], page_index),
+                        )
+                        # How much of a revised document came from earlier summaries.
+                        report["stages"]["summarize"].update(ollama_client.last_summary_stats)
+                    save_artifact(digest, SUMMARY_ARTIFACT, summary)
+            summary_output = f"{stem}.summary.txt"
+            shutil.copyfile(artifact_path(digest, SUMMARY_ARTIFACT), summary_output)
+            report["outputs"]["summary"] = summary_output
+            if args.analyze:
+                analysis_output = f"{stem}.analysis.json"
+                shutil.copyfile(artifact_path(digest, ANALYSIS_ARTIFACT), analysis_output)
+                report["outputs"]["analysis"] = analysis_output
+
+        if args.index:
+            report["stages"]["index"] = {}
+            with _Timer(report, "index"):
+                from retrieval import index_stored_document
+                report["stages"]["index"]["rows_added"] = index_stored_document(
+                    digest, args.ollama_url, workers=args.extraction_workers
+                )
+
+        if args.tts:
+            source = SUMMARY_ARTIFACT if args.tts_source == "summary" and not args.skip_summary else TEXT_ARTIFACT
+            audio_name = artifact_name("summary_audio" if source == SUMMARY_ARTIFACT else "speech", args.voice)
+            report["stages"]["tts"] = {"cached": has_artifact(digest, audio_name) and not args.force}
+            with _Timer(report, "tts"):
+                if not report["stages"]["tts"]["cached"]:
+                    from http_transport import create_elevenlabs_client
+                    from voice_generation import SpeechSynthesis, new_spool_path, split_for_speech
+                    client = create_elevenlabs_client(os.getenv("ELEVENLABS_API_KEY", "").strip())
+                    intro = [BRANDING_INTRO] if source == TEXT_ARTIFACT else []
+                    job = SpeechSynthesis(client, intro + split_for_speech(load_artifact(digest, source)), args.voice)
+                    try:
+                        if not job.run():
+                            raise RuntimeError(f"Failed to generate speech for {len(job.errors)} segment(s).")
+                        save_artifact_file(digest, audio_name, job.write_to(new_spool_path()))
+                    finally:
+                        job.cleanup()
+            audio_output = f"{stem}.mp3"
+            shutil.copyfile(artifact_path(digest, audio_name), audio_output)
+            report["outputs"]["audio"] = audio_output
+    except Exception as e:
+        report["status"] = "failed"
+        report["error"] = str(e)
+    print(f"[{report['status']}] {pdf_path}")
+    return report
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Convert folders of PDFs to text, summaries and audio.")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or glob patterns.")
+    parser.add_argument("--output", "-o", default="data/batch_output", help="Directory for the outputs.")
+    parser.add_argument("--workers", "-w", type=int, default=2, help="Files processed in parallel.")
+    parser.add_argument("--extraction-workers", type=int, default=1, help="Processes used to extract each PDF.")
+    parser.add_argument("--ollama-url", default=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"))
+    parser.add_argument("--skip-summary", action="store_true", help="Only extract text.")
+    parser.add_argument("--analyze", action="store_true",
+                        help="Also write sentiment and notes (<name>.analysis.json) alongside the summary.")
+    parser.add_argument("--index", action="store_true", help="Also add the text to the notes retrieval index.")
+    parser.add_argument("--tts", action="store_true", help="Also synthesize audio.")
+    parser.add_argument("--tts-source", choices=["summary", "text"], default="summary", help="What to voice.")
+    parser.add_argument("--voice", help="ElevenLabs voice name (required with --tts).")
+    parser.add_argument("--force", action="store_true", help="Redo every stage even if results are stored.")
+    parser.add_argument("--report", help="Path of the JSON run report (default: <output>/run_report.json).")
+    return parser
+
+
+def main(argv=None):
+    load_dotenv()
+    args = build_parser().parse_args(argv)
+    if args.tts and not args.voice:
+        print("--voice is required with --tts.")
+        return 2
+
+    pdfs = find_pdfs(args.inputs)
+    if not pdfs:
+        print("No PDF files found.")
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+
+    started = time.perf_counter()
+    started_at = datetime.now().isoformat(timespec="seconds")
+    stems = output_stems(pdfs)
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        files = list(pool.map(lambda path: process_pdf(path, args, stems[path]), pdfs))
+
+    stage_totals = {}
+    for file_report in files:
+        for stage, timing in file_report["stages"].items():
+            stage_totals[stage] = round(stage_totals.get(stage, 0) + timing.get("seconds", 0), 4)
+    report = {
+        "started": started_at,
+        "wall_seconds": round(time.perf_counter() - started, 4),
+        "workers": args.workers,
+        "files_total": len(files),
+        "files_failed": sum(1 for file_report in files if file_report["status"] != "ok"),
+        "stage_seconds": stage_totals,
+        "files": files,
+    }
+    report_path = args.report or os.path.join(args.output, "run_report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    print(f"Processed {len(files)} file(s), {report['files_failed']} failed. Report: {report_path}")
+    return 1 if report["files_failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
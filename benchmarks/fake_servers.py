@@ -0,0 +1,316 @@
+# Developer: Eric Neftali Paiz
+"""
+Local stand-ins for the Ollama and ElevenLabs HTTP APIs, used by the benchmarks.
+
+Both servers answer with synthetic payloads after a configurable delay, so the
+pipeline can be timed without a GPU, a network or an API key. They can also be
+run on their own and the app pointed at them:
+
+    python -m benchmarks.fake_servers --ollama-port 11435 --elevenlabs-port 8765
+    OLLAMA_BASE_URL=http://127.0.0.1:11435 ELEVENLABS_BASE_URL=http://127.0.0.1:8765 streamlit run main.py
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_WORDS = (
+    "the lecture covers key ideas with examples and notes on method results "
+    "context evidence summary students review concepts practice theory"
+).split()
+# ElevenLabs voice IDs are 20 alphanumeric characters; the SDK relies on that shape.
+FAKE_VOICES = [
+    {"name": "Rachel", "voice_id": "21m00Tcm4TlvDq8ikWAM"},
+    {"name": "Adam", "voice_id": "pNInz6obpgDQGcFmaJgB"},
+    {"name": "Bella", "voice_id": "EXAVITQu4vr4xnSDxMaL"},
+]
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections at shutdown is expected here.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeServer:
+    """
+    Runs a ThreadingHTTPServer on a background thread.
+
+    Subclasses provide the handler class; request counts are kept in self.stats.
+    """
+
+    handler_class = None
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.stats = {"requests": 0}
+        self._stats_lock = threading.Lock()
+        handler = type("Handler", (self.handler_class,), {"server_state": self})
+        self.httpd = _QuietHTTPServer((host, port), handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key):
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_state = None
+
+    def log_message(self, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        return json.loads(body) if body else {}
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def end_chunks(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+### Ollama ###
+class _OllamaHandler(_JsonHandler):
+    def do_POST(self):
+        state = self.server_state
+        payload = self.read_json()
+        if self.path == "/api/chat":
+            state.count("chat")
+            self.chat(payload)
+        elif self.path == "/api/embed":
+            state.count("embed")
+            state.load(payload.get("model"))
+            time.sleep(state.latency)
+            inputs = payload.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self.send_json({"model": payload.get("model"), "embeddings": [state.embed(text) for text in inputs]})
+        else:
+            self.send_json({"error": f"unknown endpoint {self.path}"}, status=404)
+
+    def chat(self, payload):
+        state = self.server_state
+        load_seconds = state.load(payload.get("model"))
+        if not payload.get("messages"):
+            # An empty chat only loads the model, as Ollama does.
+            self.send_json({
+                "model": payload.get("model"),
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "done_reason": "load",
+                "load_duration": int(load_seconds * 1e9),
+            })
+            return
+        words = state.reply_words(payload)
+        tokens = len(" ".join(words).split())
+        time.sleep(state.latency)
+        if not payload.get("stream", True):
+            time.sleep(state.token_delay * tokens)
+            self.send_json({
+                "model": payload.get("model"),
+                "message": {"role": "assistant", "content": " ".join(words)},
+                "done": True,
+                "eval_count": tokens,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        started = time.perf_counter()
+        for index, word in enumerate(words):
+            piece = word if index == 0 else f" {word}"
+            chunk = {"model": payload.get("model"), "message": {"role": "assistant", "content": piece}, "done": False}
+            self.send_chunk(json.dumps(chunk).encode("utf-8") + b"\n")
+            time.sleep(state.token_delay)
+        final = {
+            "model": payload.get("model"),
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "eval_count": len(words),
+            "eval_duration": int((time.perf_counter() - started) * 1e9),
+        }
+        self.send_chunk(json.dumps(final).encode("utf-8") + b"\n")
+        self.end_chunks()
+
+
+class FakeOllamaServer(FakeServer):
+    """
+    Answers /api/chat, streaming (NDJSON) or not, with a JSON reply filling the
+    schema's fields when format is a JSON schema, and /api/embed with hashed
+    bag-of-words vectors, so texts sharing words come out similar. The first request for each model
+    also waits load_delay, like a cold model; model names are kept in self.loaded.
+
+    Args:
+        latency (float): Seconds before the first token, i.e. prompt processing time.
+        token_delay (float): Seconds per generated token.
+        reply_tokens (int): Words in every reply.
+        load_delay (float): Seconds to "load" a model on its first request.
+    """
+
+    handler_class = _OllamaHandler
+
+    def __init__(self, latency=0.05, token_delay=0.002, reply_tokens=120, load_delay=0.0, host="127.0.0.1", port=0):
+        super().__init__(host, port)
+        self.latency = latency
+        self.token_delay = token_delay
+        self.reply_tokens = reply_tokens
+        self.load_delay = load_delay
+        self.loaded = set()
+
+    def load(self, model):
+        """Returns the seconds spent loading model for this request."""
+        with self._stats_lock:
+            if model in self.loaded:
+                return 0.0
+            self.loaded.add(model)
+        time.sleep(self.load_delay)
+        return self.load_delay
+
+    def embed(self, text, dim=64):
+        vector = [0.0] * dim
+        for word in text.lower().split():
+            word = word.strip(".,;:!?\"'()")
+            if word:
+                vector[zlib.crc32(word.encode("utf-8")) % dim] += 1.0
+        return vector
+
+    def reply_words(self, payload):
+        # Seeded from the prompt so the same prompt always gets the same reply.
+        prompt = json.dumps(payload.get("messages", []))
+        rng = random.Random(prompt)
+        schema = payload.get("format")
+        if isinstance(schema, dict) and schema.get("properties"):
+            # Structured output: every string field gets a full-length reply, sent as
+            # one JSON piece.
+            reply = {
+                field: " ".join(rng.choice(FAKE_WORDS) for _ in range(self.reply_tokens))
+                for field in schema["properties"]
+            }
+            return [json.dumps(reply)]
+        return [rng.choice(FAKE_WORDS) for _ in range(self.reply_tokens)]
+
+
+### ElevenLabs ###
+class _ElevenLabsHandler(_JsonHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/v1/voices":
+            self.server_state.count("voices")
+            time.sleep(self.server_state.latency)
+            self.send_json({"voices": FAKE_VOICES})
+        else:
+            self.send_json({"detail": f"unknown endpoint {self.path}"}, status=404)
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        if not path.startswith("/v1/text-to-speech/"):
+            self.send_json({"detail": f"unknown endpoint {self.path}"}, status=404)
+            return
+        state = self.server_state
+        state.count("tts")
+        text = self.read_json().get("text", "")
+        audio_bytes = max(1, int(len(text) * state.bytes_per_char))
+        time.sleep(state.latency)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        # Audio is streamed in pieces at the configured real-time-ish rate.
+        chunk_size = 16 * 1024
+        chunk = b"\xff" * chunk_size
+        sent = 0
+        while sent < audio_bytes:
+            size = min(chunk_size, audio_bytes - sent)
+            self.send_chunk(chunk[:size])
+            sent += size
+            time.sleep(state.chunk_delay)
+        self.end_chunks()
+
+
+class FakeElevenLabsServer(FakeServer):
+    """
+    Answers GET /v1/voices and POST /v1/text-to-speech/<voice_id>[/stream].
+
+    Args:
+        latency (float): Seconds before audio starts.
+        bytes_per_char (float): Size of the returned audio per character of text.
+        chunk_delay (float): Seconds between 16 KiB audio chunks.
+    """
+
+    handler_class = _ElevenLabsHandler
+
+    def __init__(self, latency=0.1, bytes_per_char=60, chunk_delay=0.002, host="127.0.0.1", port=0):
+        super().__init__(host, port)
+        self.latency = latency
+        self.bytes_per_char = bytes_per_char
+        self.chunk_delay = chunk_delay
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run stand-in Ollama and ElevenLabs servers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--ollama-port", type=int, default=11435)
+    parser.add_argument("--elevenlabs-port", type=int, default=8765)
+    parser.add_argument("--ollama-latency", type=float, default=0.05)
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    parser.add_argument("--reply-tokens", type=int, default=120)
+    parser.add_argument("--tts-latency", type=float, default=0.1)
+    parser.add_argument("--audio-bytes-per-char", type=float, default=60)
+    args = parser.parse_args()
+
+    ollama_server = FakeOllamaServer(args.ollama_latency, args.token_delay, args.reply_tokens,
+                                     host=args.host, port=args.ollama_port)
+    elevenlabs_server = FakeElevenLabsServer(args.tts_latency, args.audio_bytes_per_char, host=args.host, port=args.elevenlabs_port)
+    with ollama_server, elevenlabs_server:
+        print(f"Fake Ollama at {ollama_server.url}, fake ElevenLabs at {elevenlabs_server.url}. Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
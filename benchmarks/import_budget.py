@@ -0,0 +1,126 @@
+# Developer: Eric Neftali Paiz
+"""
+Checks the cold-start cost of main.py's module-level imports.
+
+Each repetition runs in a fresh interpreter and a scratch working directory, imports
+what main.py imports at the top level, and fails if:
+  - the median import time is over the budget,
+  - a module that only one view needs was loaded (see DEFERRED_MODULES), or
+  - importing created files or directories (directory setup belongs to startup,
+    not to import time).
+
+    python -m benchmarks.import_budget --budget 1.5
+
+Exits 1 on any failure so it can gate CI or a container build.
+"""
+import argparse
+import ast
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "1.5"))
+
+# Loaded only when the view or feature that needs them is used.
+DEFERRED_MODULES = [
+    "elevenlabs",                                # SDK, loaded when a view first needs a client
+    "elevenlabs.conversational_ai.conversation", # After Class Venting
+    "pyaudio",                                   # microphone/speaker access for the conversation
+    "fitz",                                      # PDF extraction in Notes to Speech
+    "cryptography",                              # only when saved settings are encrypted/decrypted
+    "ollama",                                    # async Ollama client
+]
+
+_PROBE = """
+import json, os, sys, time
+sys.path.insert(0, {repo!r})
+modules = {modules!r}
+skipped = []
+started = time.perf_counter()
+for name in modules:
+    try:
+        __import__(name)
+    except ModuleNotFoundError as e:
+        if e.name != name.split(".")[0]:
+            raise
+        skipped.append(name)
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": elapsed,
+    "skipped": skipped,
+    "loaded": [name for name in {deferred!r} if name in sys.modules],
+    "created": sorted(os.listdir(".")),
+}}))
+"""
+
+
+def startup_imports(path):
+    """
+    Returns the modules a script imports at module level (not inside functions,
+    classes or conditional blocks), in order.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def measure(modules, repeat):
+    runs = []
+    for _ in range(repeat):
+        workdir = tempfile.mkdtemp(prefix="thoughtscribe-import-")
+        try:
+            probe = _PROBE.format(repo=REPO_ROOT, modules=modules, deferred=DEFERRED_MODULES)
+            output = subprocess.run(
+                [sys.executable, "-c", probe], cwd=workdir, capture_output=True, text=True, check=True
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return runs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail if main.py's startup imports are slow or too eager.")
+    parser.add_argument("--script", default=os.path.join(REPO_ROOT, "main.py"))
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET_SECONDS, help="Median seconds allowed.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    modules = startup_imports(args.script)
+    runs = measure(modules, args.repeat)
+    median = statistics.median(run["seconds"] for run in runs)
+    failures = []
+    if median > args.budget:
+        failures.append(f"median import time {median:.3f}s is over the {args.budget:.3f}s budget")
+    loaded = sorted({name for run in runs for name in run["loaded"]})
+    if loaded:
+        failures.append(f"deferred modules loaded at startup: {', '.join(loaded)}")
+    created = sorted({name for run in runs for name in run["created"]})
+    if created:
+        failures.append(f"importing created files or directories: {', '.join(created)}")
+
+    print(f"Startup imports: {', '.join(modules)}")
+    if runs[0]["skipped"]:
+        print(f"Not installed, not measured: {', '.join(runs[0]['skipped'])}")
+    print(f"Import time over {len(runs)} run(s): median {median:.3f}s, "
+          f"min {min(run['seconds'] for run in runs):.3f}s, max {max(run['seconds'] for run in runs):.3f}s")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+# Developer: Eric Neftali Paiz
+"""
+Generates a synthetic PDF corpus for the benchmarks.
+
+    python -m benchmarks.make_corpus --output benchmarks/corpus --sizes 5 50 300
+"""
+import argparse
+import os
+import random
+import fitz  # PyMuPDF
+
+CORPUS_DIR = os.path.join("benchmarks", "corpus")
+DEFAULT_SIZES = [5, 50, 300]
+WORDS_PER_PAGE = 450
+VOCABULARY = (
+    "analysis approach argument assumption behaviour chapter claim concept context data definition "
+    "design evidence example experiment factor figure framework function hypothesis idea impact "
+    "lecture measure method model network observation outcome pattern principle process question "
+    "reading relationship research result review sample section signal source structure study "
+    "system table technique term theory topic value variable week"
+).split()
+
+
+def fake_paragraphs(rng, words):
+    """Returns roughly `words` words of sentence-shaped filler, split into paragraphs."""
+    paragraphs = []
+    while words > 0:
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            length = rng.randint(8, 20)
+            sentence = " ".join(rng.choice(VOCABULARY) for _ in range(length))
+            sentences.append(sentence.capitalize() + ".")
+            words -= length
+        paragraphs.append(" ".join(sentences))
+    return paragraphs
+
+
+def make_pdf(path, pages, seed=0, words_per_page=WORDS_PER_PAGE):
+    """
+    Writes a PDF of `pages` pages of text. The same seed always gives the same file content.
+
+    Returns:
+        str: The path written.
+    """
+    rng = random.Random(f"{seed}-{pages}")
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        text = f"Page {number + 1}\n\n" + "\n\n".join(fake_paragraphs(rng, words_per_page))
+        page.insert_textbox(page.rect + (50, 50, -50, -50), text, fontsize=9)
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    return path
+
+
+def make_corpus(output=CORPUS_DIR, sizes=None, copies=1, seed=0):
+    """
+    Generates `copies` PDFs for each page count in `sizes`, reusing files that already exist.
+
+    Returns:
+        list: Paths of the corpus PDFs.
+    """
+    os.makedirs(output, exist_ok=True)
+    paths = []
+    for pages in sizes or DEFAULT_SIZES:
+        for copy in range(copies):
+            path = os.path.join(output, f"synthetic_{pages:04d}p_{copy}.pdf")
+            if not os.path.exists(path):
+                make_pdf(path, pages, seed=seed + copy)
+            paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic PDFs for benchmarking.")
+    parser.add_argument("--output", "-o", default=CORPUS_DIR)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Page counts.")
+    parser.add_argument("--copies", type=int, default=1, help="Distinct PDFs per page count.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for path in make_corpus(args.output, args.sizes, args.copies, args.seed):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+# Developer: Eric Neftali Paiz
+"""
+Measures the PDF -> text -> summary -> speech pipeline against local stand-in servers.
+
+    python -m benchmarks.run_benchmarks                      # run and print results
+    python -m benchmarks.run_benchmarks --save-baseline      # store results as the baseline
+    python -m benchmarks.run_benchmarks --fail-on-regression # compare, exit 1 on regressions
+
+The app modules create their data/ directories relative to the working directory,
+so every run happens in a scratch directory and leaves the checkout untouched.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_servers import FAKE_VOICES, FakeElevenLabsServer, FakeOllamaServer
+from benchmarks.make_corpus import DEFAULT_SIZES, make_corpus
+
+BASELINE_PATH = os.path.join(REPO_ROOT, "benchmarks", "baseline.json")
+DEFAULT_CORPUS_DIR = os.path.join(REPO_ROOT, "benchmarks", "corpus")
+
+# Whether a bigger number is better for each metric. Metrics not listed here are
+# reported but never flagged as regressions.
+HIGHER_IS_BETTER = {
+    "extraction.pages_per_sec": True,
+    "extraction.parallel_pages_per_sec": True,
+    "summarize.p50_seconds": False,
+    "summarize.p90_seconds": False,
+    "summarize.p99_seconds": False,
+    "summarize.stream_ttft_p50_seconds": False,
+    "analyze.p50_seconds": False,
+    "analyze.short_p50_seconds": False,
+    "analyze.short_fanout_p50_seconds": False,
+    "tts.chars_per_sec": True,
+    "tts.segments_per_sec": True,
+    "tts.audio_bytes_per_sec": True,
+    "tts.cached_seconds": False,
+}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+### Stages ###
+def bench_extraction(pdfs, workers):
+    from text_extraction import count_pdf_pages, extract_text_from_pdf
+
+    pages = sum(count_pdf_pages(path) for path in pdfs)
+    texts = {}
+    started = time.perf_counter()
+    for path in pdfs:
+        texts[path] = extract_text_from_pdf(path)
+    serial_seconds = time.perf_counter() - started
+
+    metrics = {
+        "extraction.pages": pages,
+        "extraction.seconds": serial_seconds,
+        "extraction.pages_per_sec": pages / serial_seconds,
+    }
+    if workers > 1:
+        started = time.perf_counter()
+        for path in pdfs:
+            extract_text_from_pdf(path, workers=workers)
+        parallel_seconds = time.perf_counter() - started
+        metrics["extraction.parallel_seconds"] = parallel_seconds
+        metrics["extraction.parallel_pages_per_sec"] = pages / parallel_seconds
+    return metrics, texts
+
+
+def bench_summarization(texts, ollama_url, rounds):
+    from ollama_integration import OllamaIntegration
+
+    ollama_client = OllamaIntegration(base_url=ollama_url)
+    latencies = []
+    for _ in range(rounds):
+        for text in texts:
+            started = time.perf_counter()
+            ollama_client.summarize_text(text)
+            latencies.append(time.perf_counter() - started)
+
+    first_tokens = []
+    for round_number in range(max(rounds, 5)):
+        for _ in ollama_client.stream_prompt(f"Benchmark prompt {round_number}"):
+            pass
+        first_tokens.append(ollama_client.last_stream_stats["time_to_first_token"])
+
+    return {
+        "summarize.documents": len(latencies),
+        "summarize.p50_seconds": percentile(latencies, 50),
+        "summarize.p90_seconds": percentile(latencies, 90),
+        "summarize.p99_seconds": percentile(latencies, 99),
+        "summarize.stream_ttft_p50_seconds": percentile(first_tokens, 50),
+    }
+
+
+def bench_analysis(texts, ollama_url, rounds):
+    """
+    Times analyze_document against the chained calls it replaces (a summary, then
+    sentiment, then notes built from the sentiment), for whole documents and for
+    an excerpt that fits one prompt. The excerpt is also run without structured
+    output; the stand-in server decodes requests fully in parallel, which favours
+    the fan-out more than a single-GPU Ollama would.
+    """
+    from ollama_integration import OllamaIntegration
+    from text_chunking import chunk_text
+
+    ollama_client = OllamaIntegration(base_url=ollama_url)
+
+    def chained(text):
+        started = time.perf_counter()
+        ollama_client.summarize_text(text)
+        sentiment = ollama_client.analyze_sentiment(text)
+        ollama_client.send_prompt(f"Generate detailed notes based on the sentiment:\n{sentiment}", task="notes")
+        return time.perf_counter() - started
+
+    samples = {"chained": [], "analyze": [], "short_chained": [], "short_analyze": [], "short_fanout": []}
+    for _ in range(rounds):
+        for text in texts:
+            excerpt = chunk_text(text, ollama_client.summary_chunk_tokens)[0]
+            samples["chained"].append(chained(text))
+            samples["analyze"].append(ollama_client.analyze_document(text)["seconds"])
+            samples["short_chained"].append(chained(excerpt))
+            samples["short_analyze"].append(ollama_client.analyze_document(excerpt)["seconds"])
+            samples["short_fanout"].append(ollama_client.analyze_document(excerpt, structured=False)["seconds"])
+
+    return {
+        "analyze.chained_p50_seconds": percentile(samples["chained"], 50),
+        "analyze.p50_seconds": percentile(samples["analyze"], 50),
+        "analyze.short_chained_p50_seconds": percentile(samples["short_chained"], 50),
+        "analyze.short_p50_seconds": percentile(samples["short_analyze"], 50),
+        "analyze.short_fanout_p50_seconds": percentile(samples["short_fanout"], 50),
+    }
+
+
+def bench_tts(text, elevenlabs_url, rounds, max_parallel):
+    from http_transport import create_elevenlabs_client
+    from voice_generation import SpeechSynthesis, split_for_speech
+
+    client = create_elevenlabs_client("benchmark", base_url=elevenlabs_url)
+    voice_name = FAKE_VOICES[0]["name"]
+    segments = split_for_speech(text)
+    chars = audio_bytes = 0
+    seconds = 0.0
+    for round_number in range(rounds):
+        # Every round voices different text so the audio cache never answers.
+        round_segments = [f"Take {round_number}.{index}. {segment}" for index, segment in enumerate(segments)]
+        job = SpeechSynthesis(client, round_segments, voice_name, max_parallel=max_parallel)
+        try:
+            started = time.perf_counter()
+            if not job.run():
+                raise RuntimeError(f"Failed to generate speech for {len(job.errors)} segment(s).")
+            seconds += time.perf_counter() - started
+            chars += sum(len(segment) for segment in round_segments)
+            audio_bytes += sum(os.path.getsize(path) for path in job.segment_files)
+        finally:
+            job.cleanup()
+
+    # One more pass over the last round's text measures the audio cache hit path.
+    job = SpeechSynthesis(client, round_segments, voice_name, max_parallel=max_parallel)
+    try:
+        started = time.perf_counter()
+        job.run()
+        cached_seconds = time.perf_counter() - started
+    finally:
+        job.cleanup()
+
+    return {
+        "tts.segments": len(segments) * rounds,
+        "tts.chars_per_sec": chars / seconds,
+        "tts.segments_per_sec": len(segments) * rounds / seconds,
+        "tts.audio_bytes_per_sec": audio_bytes / seconds,
+        "tts.cached_seconds": cached_seconds,
+    }
+
+
+### Baseline ###
+def compare(metrics, baseline, tolerance):
+    """
+    Compares metrics to a baseline.
+
+    Args:
+        metrics (dict): Current metrics.
+        baseline (dict): Baseline metrics.
+        tolerance (float): Relative change allowed before a metric counts as regressed.
+
+    Returns:
+        list: One dict per metric present in both, with name, baseline, current,
+            change (relative) and regressed.
+    """
+    rows = []
+    for name, current in metrics.items():
+        previous = baseline.get(name)
+        if not isinstance(previous, (int, float)) or not previous:
+            continue
+        change = (current - previous) / previous
+        higher_is_better = HIGHER_IS_BETTER.get(name)
+        regressed = higher_is_better is not None and (
+            change < -tolerance if higher_is_better else change > tolerance
+        )
+        rows.append({"name": name, "baseline": previous, "current": current, "change": change, "regressed": regressed})
+    return rows
+
+
+def print_comparison(rows):
+    print(f"{'metric':<40} {'baseline':>12} {'current':>12} {'change':>9}")
+    for row in rows:
+        flag = "  REGRESSED" if row["regressed"] else ""
+        print(f"{row['name']:<40} {row['baseline']:>12.4f} {row['current']:>12.4f} {row['change']:>+8.1%}{flag}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark extraction, summarization and TTS.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_DIR, help="Directory for the synthetic PDFs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Corpus page counts.")
+    parser.add_argument("--rounds", type=int, default=3, help="Repetitions of the summarize and TTS stages.")
+    parser.add_argument("--extraction-workers", type=int, default=4)
+    parser.add_argument("--summarize-max-pages", type=int, default=50,
+                        help="Only summarize corpus PDFs up to this many pages.")
+    parser.add_argument("--ollama-latency", type=float, default=0.05)
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    parser.add_argument("--reply-tokens", type=int, default=120)
+    parser.add_argument("--tts-latency", type=float, default=0.1)
+    parser.add_argument("--tts-chars", type=int, default=20000, help="Characters voiced per TTS round.")
+    parser.add_argument("--tts-parallel", type=int, default=3)
+    parser.add_argument("--audio-bytes-per-char", type=float, default=60)
+    parser.add_argument("--skip", nargs="*", default=[], choices=["extraction", "summarize", "analyze", "tts"])
+    parser.add_argument("--output", help="Write the results JSON here.")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Relative change counted as a regression.")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    corpus_dir = os.path.abspath(args.corpus)
+    baseline_path = os.path.abspath(args.baseline)
+    output_path = os.path.abspath(args.output) if args.output else None
+    pdfs = make_corpus(corpus_dir, args.sizes)
+
+    workdir = tempfile.mkdtemp(prefix="thoughtscribe-bench-")
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    metrics = {}
+    try:
+        from text_extraction import count_pdf_pages, extract_text_from_pdf
+
+        if "extraction" not in args.skip:
+            print("Benchmarking extraction...")
+            stage_metrics, texts = bench_extraction(pdfs, args.extraction_workers)
+            metrics.update(stage_metrics)
+        else:
+            texts = {path: extract_text_from_pdf(path) for path in pdfs}
+
+        ollama_server = FakeOllamaServer(args.ollama_latency, args.token_delay, args.reply_tokens)
+        elevenlabs_server = FakeElevenLabsServer(args.tts_latency, args.audio_bytes_per_char)
+        with ollama_server, elevenlabs_server:
+            if "summarize" not in args.skip:
+                print("Benchmarking summarization...")
+                to_summarize = [text for path, text in texts.items() if count_pdf_pages(path) <= args.summarize_max_pages]
+                metrics.update(bench_summarization(to_summarize or list(texts.values())[:1], ollama_server.url, args.rounds))
+                metrics["summarize.ollama_requests"] = ollama_server.stats["requests"]
+            if "analyze" not in args.skip:
+                print("Benchmarking document analysis...")
+                to_analyze = [text for path, text in texts.items() if count_pdf_pages(path) <= args.summarize_max_pages]
+                metrics.update(bench_analysis(to_analyze or list(texts.values())[:1], ollama_server.url, args.rounds))
+            if "tts" not in args.skip:
+                print("Benchmarking speech synthesis...")
+                tts_text = "\n\n".join(texts.values())[:args.tts_chars]
+                metrics.update(bench_tts(tts_text, elevenlabs_server.url, args.rounds, args.tts_parallel))
+                metrics["tts.elevenlabs_requests"] = elevenlabs_server.stats["requests"]
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "metrics": {name: round(value, 6) for name, value in metrics.items()},
+    }
+    for name, value in results["metrics"].items():
+        print(f"{name:<40} {value:>14.4f}")
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+    regressions = []
+    if args.save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+        print(f"Saved baseline to {baseline_path}")
+    elif os.path.exists(baseline_path):
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nCompared with baseline from {baseline.get('created')}:")
+        rows = compare(results["metrics"], baseline["metrics"], args.tolerance)
+        print_comparison(rows)
+        regressions = [row["name"] for row in rows if row["regressed"]]
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
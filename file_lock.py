@@ -0,0 +1,60 @@
+# Developer: Eric Neftali Paiz
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Files under data/ are shared by the Streamlit app, batch_cli and job workers, so
+# updates that read-modify-write them are serialized across processes with a lock
+# file next to them, not just a threading.Lock.
+
+
+class FileLock:
+    """
+    Exclusive, blocking lock held on a lock file; works across threads and processes.
+
+    Use a new instance (or the same one from one thread at a time) per `with` block.
+
+    Args:
+        path (str): The lock file. Created if missing and never deleted.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a+b")
+        try:
+            if fcntl:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            else:
+                self._file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        # LK_LOCK gives up after about ten seconds; keep waiting.
+                        time.sleep(0.05)
+        except BaseException:
+            self._file.close()
+            self._file = None
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            if fcntl:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,228 @@
+# Developer: Eric Neftali Paiz
+import logging
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from instrumentation import log_event
+
+# Shared outbound HTTP for Ollama and ElevenLabs: one keep-alive connection pool per
+# process, timeouts on every call and jittered retries. By default only failures
+# where the server cannot have acted on the request are retried: connection
+# failures and 429/503 answers. Timeouts, dropped connections and other 5xx
+# responses may come after a POST was processed (a duplicate agent, another
+# two-minute generation), so retrying them is opt-in per call.
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+RETRY_STATUSES = {429, 503}
+# Also retried for calls marked idempotent.
+IDEMPOTENT_RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+# Overrides the ElevenLabs API host, e.g. to point at the stand-in server in benchmarks/.
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL")
+
+_session = None
+_httpx_client = None
+_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Returns the process-wide requests session, creating it on first use.
+
+    Returns:
+        requests.Session: Session with a pooled adapter for http and https.
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Seconds to wait before retry number `attempt` (0-based), using full jitter.
+    A numeric Retry-After header from the server takes precedence.
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _never_sent(error):
+    """True if a requests exception means the request never reached the server."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def request(method, url, timeout=None, retries=None, idempotent=None, **kwargs):
+    """
+    Sends an HTTP request through the shared session, retrying with jittered
+    exponential backoff when the server could not have acted on it (connection
+    failures, 429 and 503).
+
+    Args:
+        method (str): HTTP method.
+        url (str): Target URL.
+        timeout: Seconds or a (connect, read) tuple. Defaults to the configured timeouts.
+        retries (int): Retries after the first attempt. Defaults to MAX_RETRIES; 0
+            sends the request exactly once.
+        idempotent (bool): Also retry timeouts, dropped connections and 500/502/504,
+            for requests that are safe to repeat. Defaults to True for GET, HEAD and
+            OPTIONS only.
+        kwargs: Passed through to requests (json, headers, stream, ...).
+
+    Returns:
+        requests.Response: The last response received. Callers check the status as before.
+    """
+    timeout = timeout if timeout is not None else (CONNECT_TIMEOUT, READ_TIMEOUT)
+    retries = MAX_RETRIES if retries is None else retries
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    retry_statuses = IDEMPOTENT_RETRY_STATUSES if idempotent else RETRY_STATUSES
+    session = get_session()
+    for attempt in range(retries + 1):
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == retries or not (idempotent or _never_sent(e)):
+                raise
+            delay = backoff_delay(attempt)
+            log_event("HTTP request failed, retrying", logging.WARNING,
+                      method=method, url=url, error=str(e), attempt=attempt + 1, delay=round(delay, 2))
+            time.sleep(delay)
+            continue
+        if response.status_code not in retry_statuses or attempt == retries:
+            return response
+        delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+        log_event("HTTP request rejected, retrying", logging.WARNING,
+                  method=method, url=url, status=response.status_code, attempt=attempt + 1, delay=round(delay, 2))
+        response.close()
+        time.sleep(delay)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def _httpx_retry_delay(request, attempt, error=None, response=None):
+    """Logs a retry of an httpx request and returns the seconds to wait before it."""
+    if error is not None:
+        delay = backoff_delay(attempt)
+        log_event("HTTP request failed, retrying", logging.WARNING, method=request.method,
+                  url=str(request.url), error=str(error), attempt=attempt + 1, delay=round(delay, 2))
+    else:
+        delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+        log_event("HTTP request rejected, retrying", logging.WARNING, method=request.method,
+                  url=str(request.url), status=response.status_code, attempt=attempt + 1, delay=round(delay, 2))
+    return delay
+
+
+def httpx_timeout():
+    import httpx
+    return httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+def get_httpx_client():
+    """
+    Returns the process-wide httpx client used by the ElevenLabs SDK, with the same
+    pooling, timeouts and default retry policy as the requests session.
+    """
+    global _httpx_client
+    if _httpx_client is None:
+        with _lock:
+            if _httpx_client is None:
+                import httpx
+
+                class RetryingTransport(httpx.HTTPTransport):
+                    def handle_request(self, request):
+                        for attempt in range(MAX_RETRIES + 1):
+                            try:
+                                response = super().handle_request(request)
+                            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                                if attempt == MAX_RETRIES:
+                                    raise
+                                time.sleep(_httpx_retry_delay(request, attempt, error=e))
+                                continue
+                            if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                                return response
+                            response.close()
+                            time.sleep(_httpx_retry_delay(request, attempt, response=response))
+
+                limits = httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+                _httpx_client = httpx.Client(transport=RetryingTransport(limits=limits), timeout=httpx_timeout())
+    return _httpx_client
+
+
+def create_async_transport():
+    """
+    Builds an httpx async transport with the same pooling and default retry policy
+    as get_httpx_client. Async connections belong to one event loop, so each async
+    client gets its own transport instead of a process-wide one; close it with
+    `await transport.aclose()`.
+    """
+    import asyncio
+    import httpx
+
+    class RetryingAsyncTransport(httpx.AsyncHTTPTransport):
+        async def handle_async_request(self, request):
+            for attempt in range(MAX_RETRIES + 1):
+                try:
+                    response = await super().handle_async_request(request)
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    if attempt == MAX_RETRIES:
+                        raise
+                    await asyncio.sleep(_httpx_retry_delay(request, attempt, error=e))
+                    continue
+                if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    return response
+                await response.aclose()
+                await asyncio.sleep(_httpx_retry_delay(request, attempt, response=response))
+
+    limits = httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+    return RetryingAsyncTransport(limits=limits)
+
+
+def create_elevenlabs_client(api_key, base_url=None):
+    """
+    Builds an ElevenLabs client that sends its requests over the shared pool.
+
+    Args:
+        api_key (str): The ElevenLabs API key.
+        base_url (str): Optional API host. Defaults to ELEVENLABS_BASE_URL, or the
+            public API when that is unset.
+
+    Returns:
+        ElevenLabs: The client instance.
+    """
+    from elevenlabs.client import ElevenLabs
+    base_url = base_url or ELEVENLABS_BASE_URL
+    if base_url:
+        # The SDK's own base_url argument forces https, so the environment is given explicitly.
+        from elevenlabs.environment import ElevenLabsEnvironment
+        base_url = base_url.rstrip("/")
+        environment = ElevenLabsEnvironment(base=base_url, wss=base_url.replace("http", "ws", 1))
+        return ElevenLabs(api_key=api_key, environment=environment, httpx_client=get_httpx_client())
+    return ElevenLabs(api_key=api_key, httpx_client=get_httpx_client())
@@ -0,0 +1,395 @@
+# Developer: Eric Neftali Paiz
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Timing spans around the slow parts of the pipeline (extraction, prompt building,
+# Ollama calls, voice lookup, TTS, file I/O). Every span is written as a structured
+# log line tagged with the session and trace it belongs to, and folded into
+# histograms served in Prometheus text format on METRICS_HOST:METRICS_PORT/metrics.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" for one JSON object per line, "text" for human-readable lines.
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# 0 disables the metrics endpoint.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Sampling profiler for hot spans: list span names in PROFILE_SPANS (comma
+# separated) and a PROFILE_SAMPLE_RATE fraction of them is profiled. Profiles of
+# spans that took at least PROFILE_MIN_SECONDS are written to PROFILE_DIR as
+# folded stacks, ready for flamegraph.pl or speedscope.
+PROFILE_SPANS = {name.strip() for name in os.getenv("PROFILE_SPANS", "").split(",") if name.strip()}
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "1.0"))
+PROFILE_MIN_SECONDS = float(os.getenv("PROFILE_MIN_SECONDS", "1.0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_DIR = os.path.join("data", "profiles")
+
+logger = logging.getLogger("thoughtscribe")
+
+_session_id = contextvars.ContextVar("session_id", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+### Structured Logs ###
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = " ".join(f"{key}={value}" for key, value in getattr(record, "fields", {}).items())
+        return f"{datetime.fromtimestamp(record.created):%H:%M:%S} {record.levelname:<7} {record.getMessage()} {fields}".rstrip()
+
+
+def configure_logging(level=LOG_LEVEL, log_format=LOG_FORMAT, stream=None):
+    """
+    Sends the "thoughtscribe" logger to stderr (or `stream`) in JSON or text form.
+    Safe to call again, e.g. to switch format; the previous handler is replaced.
+    """
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """
+    Writes a structured log line, tagged with the current session and span.
+
+    Args:
+        event (str): What happened, e.g. "Preparing Ollama messages".
+        level (int): logging level.
+        fields: Extra key/value pairs for the log line.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    current = _current_span.get()
+    context = {"session_id": _session_id.get()}
+    if current is not None:
+        context["trace_id"] = current.trace_id
+        context["span_id"] = current.span_id
+    context.update(fields)
+    logger.log(level, event, extra={"fields": {key: value for key, value in context.items() if value is not None}})
+
+
+def set_session(session_id):
+    """Tags spans and log lines from the current context (thread or task) with a session ID."""
+    _session_id.set(session_id)
+
+
+def get_session():
+    return _session_id.get()
+
+
+@contextmanager
+def session(session_id):
+    token = _session_id.set(session_id)
+    try:
+        yield
+    finally:
+        _session_id.reset(token)
+
+
+def bind(fn):
+    """
+    Wraps fn to run in a copy of the caller's context, so spans it opens on a
+    worker thread keep their parent span and session. Bind once per task.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        return context.run(fn, *args, **kwargs)
+    return run
+
+
+### Metrics ###
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in items) + "}"
+
+
+class MetricsRegistry:
+    """
+    In-process counters, gauges and histograms, rendered in the Prometheus text format.
+    Label sets are passed as keyword arguments.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, buckets=SPAN_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+                self.histograms[key] = histogram
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram["counts"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def render(self):
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {key: dict(value, counts=list(value["counts"])) for key, value in self.histograms.items()}
+        lines = []
+        for kind, series in (("counter", counters), ("gauge", gauges), ("histogram", histograms)):
+            for name in sorted({name for name, _ in series}):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (series_name, labels), value in sorted(series.items()):
+                    if series_name != name:
+                        continue
+                    if kind != "histogram":
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+                        continue
+                    for bound, count in zip(value["buckets"], value["counts"]):
+                        lines.append(f"{name}_bucket{_format_labels(labels, {'le': bound})} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, {'le': '+Inf'})} {value['count']}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {value['sum']}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.describe("thoughtscribe_span_duration_seconds", "Duration of instrumented operations.")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """
+    Serves /metrics from a background thread, once per process. Returns None when
+    disabled (port 0) or when the port is taken, e.g. by another app process.
+    """
+    global _metrics_server
+    with _metrics_server_lock:
+        if _metrics_server is None and port:
+            try:
+                server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                log_event("Metrics endpoint not started", logging.WARNING, address=f"{host}:{port}", error=str(e))
+                return None
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+            _metrics_server = server
+            log_event("Metrics endpoint started", address=f"http://{host}:{server.server_address[1]}/metrics")
+        return _metrics_server
+
+
+### Sampling Profiler ###
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread at a fixed interval from a background thread
+    and counts them as folded stacks ("thread;outer;...;inner count").
+    """
+
+    def __init__(self, name, interval=PROFILE_INTERVAL):
+        self.name = name
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own_ident = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            frames.append(names.get(ident, str(ident)))
+            self.stacks[";".join(reversed(frames))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def save(self, directory=PROFILE_DIR):
+        """
+        Writes the folded stacks to a file.
+
+        Returns:
+            str: Path of the profile.
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.name}-{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def _should_profile(name, profile):
+    if profile is not None:
+        return profile
+    return name in PROFILE_SPANS and random.random() < PROFILE_SAMPLE_RATE
+
+
+### Spans ###
+class Span:
+    def __init__(self, name, tags, parent):
+        self.name = name
+        self.tags = tags
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent is not None else None
+        self.status = "ok"
+        self.duration = None
+
+    def set_tag(self, **tags):
+        self.tags.update(tags)
+
+
+@contextmanager
+def span(name, profile=None, **tags):
+    """
+    Times a block of work.
+
+    On exit the duration is added to the thoughtscribe_span_duration_seconds
+    histogram and a "span" log line is written with the tags, status and the
+    parent span, so nested calls can be correlated.
+
+    Args:
+        name (str): Operation name, e.g. "ollama.chat".
+        profile (bool): Force the sampling profiler on or off for this span.
+            Defaults to profiling spans listed in PROFILE_SPANS.
+        tags: Values to attach to the log line (model, chars, cached, ...).
+
+    Yields:
+        Span: Call set_tag on it to add tags known only at the end.
+    """
+    current = Span(name, tags, _current_span.get())
+    token = _current_span.set(current)
+    profiler = SamplingProfiler(name).start() if _should_profile(name, profile) else None
+    started = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.status = "error"
+        current.tags["error"] = str(e)[:200]
+        raise
+    except BaseException:
+        current.status = "cancelled"
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # A generator span finished from another context (e.g. closed by the GC).
+            pass
+        if profiler is not None:
+            profiler.stop()
+            if current.duration >= PROFILE_MIN_SECONDS and profiler.samples:
+                current.tags["profile"] = profiler.save()
+        metrics.observe("thoughtscribe_span_duration_seconds", current.duration, span=name, status=current.status)
+        log_event(
+            "span",
+            logging.INFO if current.status == "ok" else logging.WARNING,
+            span=name,
+            duration_ms=round(current.duration * 1000, 3),
+            status=current.status,
+            trace_id=current.trace_id,
+            span_id=current.span_id,
+            parent_id=current.parent_id,
+            **current.tags,
+        )
+
+
+def timed(name, **tags):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, **tags):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+configure_logging()
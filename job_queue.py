@@ -0,0 +1,401 @@
+# Developer: Eric Neftali Paiz
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from instrumentation import get_session, log_event, session, span
+from storage_janitor import data_dir, ensure_data_dirs, notify_write
+
+# Long summarization and synthesis work runs on a local worker pool instead of the
+# Streamlit script thread. Every job is persisted as data/jobs/<id>.json, so the UI
+# can poll it after a rerun or page reload, and unfinished jobs are picked up
+# again when the process restarts. The records are read from disk once, at
+# start-up; after that lookups only touch memory.
+JOBS_DIR = data_dir("data/jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Minimum seconds between progress writes to a job record.
+JOB_SAVE_INTERVAL = 0.5
+# Finished jobs are forgotten (record deleted) once they are older than
+# JOB_MAX_AGE_DAYS or when more than JOB_HISTORY_LIMIT finished jobs are kept.
+JOB_MAX_AGE_DAYS = float(os.getenv("JOB_MAX_AGE_DAYS", "7"))
+JOB_HISTORY_LIMIT = int(os.getenv("JOB_HISTORY_LIMIT", "500"))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = {COMPLETED, FAILED, CANCELLED}
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _job_path(job_id):
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _params_key(kind, params):
+    return kind, json.dumps(params, sort_keys=True, ensure_ascii=False)
+
+
+class JobContext:
+    """
+    Handed to a job handler to report progress and partial output and to check
+    for cancellation.
+    """
+
+    def __init__(self, job_queue, job):
+        self._queue = job_queue
+        self.job = job
+        self.cancel_event = job_queue._cancel_events[job["id"]]
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def progress(self, stage, completed, total):
+        self.check_cancelled()
+        self.job["progress"] = {"stage": stage, "completed": completed, "total": total}
+        self._queue._save(self.job)
+
+    def partial(self, output):
+        self.check_cancelled()
+        self.job["partial"] = output
+        self._queue._save(self.job)
+
+
+class JobQueue:
+    """
+    Runs registered job handlers on a thread pool and keeps their records on disk.
+
+    A handler is a callable(params, secrets, context) returning a JSON-serializable
+    result. Secrets (API keys) are kept in memory only and never written to the
+    job record.
+    """
+
+    def __init__(self, workers=JOB_WORKERS):
+        ensure_data_dirs()
+        self.handlers = {}
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = {}
+        # (kind, params) -> ID of the most recently created job with exactly those params.
+        self._latest = {}
+        self._secrets = {}
+        self._cancel_events = {}
+        self._last_saved = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def register_handler(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def _save(self, job, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_saved.get(job["id"], 0) < JOB_SAVE_INTERVAL:
+            return
+        self._last_saved[job["id"]] = now
+        job["updated"] = _now()
+        path = _job_path(job["id"])
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        notify_write(path)
+
+    def _execute(self, job_id):
+        job = self._jobs[job_id]
+        if self._cancel_events[job_id].is_set():
+            job["status"] = CANCELLED
+            self._save(job, force=True)
+            return
+        job["status"] = RUNNING
+        job["started"] = _now()
+        self._save(job, force=True)
+        try:
+            handler = self.handlers[job["kind"]]
+            with session(job.get("session_id")), span(f"job.{job['kind']}", job_id=job_id):
+                job["result"] = handler(job["params"], self._secrets.get(job_id, {}), JobContext(self, job))
+            job["status"] = COMPLETED
+        except JobCancelled:
+            job["status"] = CANCELLED
+        except Exception as e:
+            log_event("Job failed", logging.ERROR, job_id=job_id, kind=job["kind"], error=str(e))
+            job["status"] = FAILED
+            job["error"] = str(e)
+        finally:
+            self._secrets.pop(job_id, None)
+            self._save(job, force=True)
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+                self._last_saved.pop(job_id, None)
+            self.prune()
+
+    def _add(self, job):
+        # Callers hold self._lock.
+        self._jobs[job["id"]] = job
+        key = _params_key(job["kind"], job["params"])
+        latest = self._jobs.get(self._latest.get(key))
+        if latest is None or job["created"] >= latest["created"]:
+            self._latest[key] = job["id"]
+
+    def _enqueue(self, job, secrets=None):
+        with self._lock:
+            self._add(job)
+            self._cancel_events[job["id"]] = threading.Event()
+            if secrets:
+                self._secrets[job["id"]] = secrets
+        self._save(job, force=True)
+        self.pool.submit(self._execute, job["id"])
+
+    def submit(self, kind, params, secrets=None):
+        """
+        Queues a job.
+
+        Args:
+            kind (str): Registered handler name, e.g. "summarize" or "speech".
+            params (dict): JSON-serializable parameters, persisted with the job.
+            secrets (dict): Values the handler needs that must not be persisted.
+
+        Returns:
+            str: The job ID.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}'.")
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "params": params,
+            "status": QUEUED,
+            "progress": None,
+            "partial": None,
+            "result": None,
+            "error": None,
+            "session_id": get_session(),
+            "created": _now(),
+        }
+        self._enqueue(job, secrets)
+        return job["id"]
+
+    def get(self, job_id):
+        """
+        Returns a snapshot of a job record, or None if the job is unknown.
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return dict(job)
+        path = _job_path(job_id)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return None
+
+    def find_latest(self, kind, **params):
+        """
+        Returns the most recently created job of a kind whose params match, or None.
+        Only the latest job per distinct set of params is considered, from memory.
+        """
+        with self._lock:
+            matches = [
+                self._jobs[job_id] for (job_kind, _), job_id in self._latest.items()
+                if job_kind == kind and all(self._jobs[job_id]["params"].get(key) == value for key, value in params.items())
+            ]
+            latest = max(matches, key=lambda job: job["created"]) if matches else None
+            return dict(latest) if latest else None
+
+    def list_jobs(self):
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()]
+
+    def _load(self):
+        """Reads the job records left by previous runs, once per process."""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            with os.scandir(JOBS_DIR) as it:
+                for entry in it:
+                    if entry.name.endswith(".json") and entry.name[:-5] not in self._jobs:
+                        try:
+                            with open(entry.path, "r", encoding="utf-8") as f:
+                                self._add(json.load(f))
+                        except (OSError, ValueError, KeyError):
+                            continue
+
+    def prune(self):
+        """
+        Forgets finished jobs older than JOB_MAX_AGE_DAYS, and the oldest finished
+        jobs beyond JOB_HISTORY_LIMIT, deleting their records.
+
+        Returns:
+            int: Number of jobs removed.
+        """
+        cutoff = (datetime.now() - timedelta(days=JOB_MAX_AGE_DAYS)).isoformat(timespec="seconds")
+        with self._lock:
+            finished = sorted(
+                (job for job in self._jobs.values() if job["status"] in FINISHED_STATUSES),
+                key=lambda job: job["created"], reverse=True,
+            )
+            expired = [
+                job for position, job in enumerate(finished)
+                if position >= JOB_HISTORY_LIMIT or job["created"] < cutoff
+            ]
+            for job in expired:
+                del self._jobs[job["id"]]
+                key = _params_key(job["kind"], job["params"])
+                if self._latest.get(key) == job["id"]:
+                    del self._latest[key]
+        for job in expired:
+            try:
+                os.remove(_job_path(job["id"]))
+                notify_write(_job_path(job["id"]))
+            except FileNotFoundError:
+                pass
+        return len(expired)
+
+    def cancel(self, job_id):
+        event = self._cancel_events.get(job_id)
+        if event is None:
+            return False
+        event.set()
+        return True
+
+    def resume_unfinished(self):
+        """
+        Loads the job records of previous runs and requeues jobs that were queued
+        or running when the process last stopped.
+        """
+        self._load()
+        self.prune()
+        with self._lock:
+            unfinished = [
+                job for job in self._jobs.values()
+                if job["status"] in (QUEUED, RUNNING) and job["id"] not in self._cancel_events and job["kind"] in self.handlers
+            ]
+        for job in unfinished:
+            job["status"] = QUEUED
+            self._enqueue(job)
+        if unfinished:
+            log_event("Resumed unfinished jobs", jobs=len(unfinished))
+        return len(unfinished)
+
+
+### Built-in Handlers ###
+def run_summarize_job(params, secrets, context):
+    """
+    Summarizes a stored document, publishing the summary as it streams in. Parts
+    of the document summarized before, e.g. unchanged pages of a revised upload,
+    come from the summary cache; the result reports how much was reused.
+
+    Params:
+        digest: Store digest of the document.
+        base_url: Ollama base URL.
+        pages: Optional [start, stop] page range to summarize instead of the whole document.
+    """
+    from artifact_store import PAGE_INDEX_ARTIFACT, has_artifact, save_artifact, summary_artifact
+    from ollama_integration import OllamaIntegration
+    from text_extraction import load_page_hashes, load_page_index, load_pages
+
+    if not has_artifact(params["digest"], PAGE_INDEX_ARTIFACT):
+        raise ValueError("The document has not been extracted yet.")
+    pages = params.get("pages")
+    index = load_page_index(params["digest"])
+    start, stop = pages or (0, index["pages"])
+    ollama_client = OllamaIntegration(base_url=params["base_url"])
+    summary = ""
+    for piece in ollama_client.summarize_pages_stream(
+        load_pages(params["digest"], start, stop, index),
+        load_page_hashes(params["digest"], start, stop, index),
+        progress_callback=context.progress,
+    ):
+        summary += piece
+        context.partial(summary)
+    artifact = summary_artifact(pages)
+    save_artifact(params["digest"], artifact, summary)
+    return {
+        "artifact": artifact,
+        "stream_stats": ollama_client.last_stream_stats,
+        "summary_stats": ollama_client.last_summary_stats,
+    }
+
+
+def run_speech_job(params, secrets, context):
+    """
+    Synthesizes stored text to an audio artifact. Segments already voiced are
+    served from the audio cache, so a resumed or retried job only synthesizes
+    what is missing.
+
+    Params:
+        digest: Store digest of the document.
+        source: Artifact holding the text to voice (text or summary).
+        voice_name: ElevenLabs voice name.
+        artifact: Name of the audio artifact to produce.
+        intro: Optional text voiced before the document.
+        pages: Optional [start, stop] page range of the extracted text to voice.
+    """
+    from artifact_store import TEXT_ARTIFACT, load_artifact, save_artifact_file
+    from http_transport import create_elevenlabs_client
+    from text_extraction import load_page_range_text
+    from voice_generation import SpeechSynthesis, new_spool_path, split_for_speech
+
+    if params.get("pages") and params["source"] == TEXT_ARTIFACT:
+        text = load_page_range_text(params["digest"], params["pages"])
+    else:
+        text = load_artifact(params["digest"], params["source"])
+    if text is None:
+        raise ValueError(f"Nothing to voice: '{params['source']}' has not been produced yet.")
+    api_key = secrets.get("api_key") or os.getenv("ELEVENLABS_API_KEY", "").strip()
+    client = create_elevenlabs_client(api_key)
+    segments = ([params["intro"]] if params.get("intro") else []) + split_for_speech(text)
+    job = SpeechSynthesis(client, segments, params["voice_name"])
+    try:
+        job.run(progress_callback=lambda completed, total: context.progress("speech", completed, total))
+        if not job.is_complete:
+            raise RuntimeError(f"Failed to generate speech for {len(job.errors)} of {len(segments)} segment(s).")
+        spool_path = job.write_to(new_spool_path())
+        save_artifact_file(params["digest"], params["artifact"], spool_path)
+    finally:
+        job.cleanup()
+    return {"artifact": params["artifact"]}
+
+
+def run_index_job(params, secrets, context):
+    """
+    Adds an extracted document to the retrieval index. Documents already indexed
+    are skipped, so this is safe to submit for every upload.
+
+    Params:
+        digest: Store digest of the document.
+        base_url: Ollama base URL (embeddings are computed there).
+    """
+    from retrieval import index_stored_document
+
+    return {"rows": index_stored_document(params["digest"], params["base_url"])}
+
+
+def start_job_queue(workers=JOB_WORKERS):
+    """
+    Starts the process-wide job queue once, with the built-in handlers registered
+    and unfinished jobs from a previous run resumed.
+    """
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(workers)
+            _job_queue.register_handler("summarize", run_summarize_job)
+            _job_queue.register_handler("speech", run_speech_job)
+            _job_queue.register_handler("index", run_index_job)
+            _job_queue.resume_unfinished()
+        return _job_queue
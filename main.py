@@ -1,14 +1,21 @@
 # Developer: Eric Neftali Paiz
 import streamlit as st
-from elevenlabs.client import ElevenLabs
-from text_extraction import extract_text_from_pdf, save_uploaded_file
-from voice_generation import generate_speech, get_voices, create_agent
+from artifact_store import (
+    PAGE_INDEX_ARTIFACT, SOURCE_ARTIFACT, TEXT_ARTIFACT,
+    artifact_name, artifact_path, has_artifact, load_artifact, page_range_label, store_uploaded_file, summary_artifact,
+)
+from voice_generation import get_voices
+from job_queue import CANCELLED, COMPLETED, FAILED, FINISHED_STATUSES, start_job_queue
+from http_transport import create_elevenlabs_client, post
+from storage_janitor import data_dir, ensure_data_dirs, notify_access, notify_write, start_janitor
+from instrumentation import set_session, start_metrics_server
+from model_manager import start_model_warmup
 from dotenv import load_dotenv
-import os, requests
-import io
-from elevenlabs.conversational_ai.conversation import Conversation
+import os
+import shutil
+import time
+import uuid
 from util import *
-from elevenlabs.conversational_ai.default_audio_interface import DefaultAudioInterface
 import streamlit.components.v1 as components
 
 
@@ -18,6 +25,26 @@ st.set_page_config(
 )
 
 load_dotenv()
+# Directory setup and the background services below run once per process; on
+# reruns they are no-ops. View-specific modules (PDF extraction, the voice
+# conversation stack) are imported inside their views.
+ensure_data_dirs()
+# Keeps data/ within its quotas from a background thread; started once per process.
+start_janitor()
+# Summaries and speech run as background jobs that survive reruns and reloads.
+job_queue = start_job_queue()
+# Span timings in Prometheus text format on METRICS_HOST:METRICS_PORT/metrics.
+start_metrics_server()
+# Correlates spans and logs from this browser session's reruns and jobs.
+set_session(st.session_state.setdefault("session_id", uuid.uuid4().hex))
+JOB_POLL_INTERVAL = 0.5
+# Pages of extracted text sent to the browser at a time.
+PAGES_PER_VIEW = int(os.getenv("PAGES_PER_VIEW", "5"))
+# Audio up to this size is played inline. Streamlit 1.25 holds inline media in
+# memory, so larger files are offered as a link that Streamlit's static file
+# handler streams from disk (server.enableStaticServing in .streamlit/config.toml).
+AUDIO_INLINE_MAX_BYTES = int(os.getenv("AUDIO_INLINE_MAX_MB", "20")) * 1024 * 1024
+STATIC_AUDIO_DIR = data_dir(os.path.join("static", "audio"))
 agent_id = os.getenv("AGENT_ID")
 user_settings = load_user_settings()
 st.session_state.update(user_settings)
@@ -96,7 +123,8 @@ def create_agent(api_key, agent_name, voice_id, llm, system_prompt):
         "name": agent_name,
         "default_voice_id": voice_id
     }
-    response = requests.post(url, headers=headers, json=payload)
+    # Sent once: a retried create could leave a duplicate agent behind.
+    response = post(url, headers=headers, json=payload, retries=0)
     if response.status_code == 200:
         return response.json()["agent_id"]
     else:
@@ -104,6 +132,55 @@ def create_agent(api_key, agent_name, voice_id, llm, system_prompt):
 
 
 
+# Streamlit re-runs this script on every interaction, so anything expensive is
+# memoized: clients per API key, page indexes and page ranges per content digest
+# (shared across sessions) and upload -> digest per session, all with bounded
+# entry counts.
+@st.cache_resource(max_entries=8, show_spinner=False)
+def get_elevenlabs_client(api_key):
+    return create_elevenlabs_client(api_key)
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def load_document_page_index(document_digest):
+    from text_extraction import load_page_index
+    return load_page_index(document_digest)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_document_pages(document_digest, start, stop):
+    from text_extraction import load_pages
+    return load_pages(document_digest, start, stop, load_document_page_index(document_digest))
+
+
+def get_upload_digest(uploaded_file):
+    """
+    Returns the store digest for an upload, hashing and storing it only the first
+    time this session sees that upload, or again if the storage janitor has
+    evicted it since.
+    """
+    upload_key = (
+        getattr(uploaded_file, "file_id", None) or getattr(uploaded_file, "id", None),
+        uploaded_file.name,
+        uploaded_file.size,
+    )
+    upload_digests = st.session_state.setdefault("upload_digests", {})
+    digest = upload_digests.get(upload_key)
+    # Checking the source also marks the object as in use, so the janitor leaves
+    # it alone while this session works with it.
+    if digest and not has_artifact(digest, SOURCE_ARTIFACT):
+        del upload_digests[upload_key]
+        # Page indexes and pages cached for the evicted object would point at
+        # files that no longer exist.
+        load_document_page_index.clear()
+        load_document_pages.clear()
+    if upload_key not in upload_digests:
+        if len(upload_digests) >= 16:
+            upload_digests.pop(next(iter(upload_digests)))
+        upload_digests[upload_key] = store_uploaded_file(uploaded_file)
+    return upload_digests[upload_key]
+
+
 def load_file_content(file_path):
     try:
         with open(file_path, "r", encoding="utf-8") as file:
@@ -127,7 +204,7 @@ def agent_setup():
         st.error("Missing ElevenLabs API key. Please check your .env file or input it above.")
         return 
     try:
-        client = ElevenLabs(api_key=api_key)
+        client = get_elevenlabs_client(api_key)
         voice_choices = [voice["Name"] for voice in get_voices(client)]
         st.session_state["show_api_warning"] = False
     except Exception as e:
@@ -136,10 +213,6 @@ def agent_setup():
 
     agent_name = st.text_input("Agent Name:", value="Custom Agent")
 
-    client = ElevenLabs(api_key=api_key)
-    
-    voice_choices = [voice["Name"] for voice in get_voices(client)]
-
     llm_choices = [
     "claude-3-5-sonnet",
     "claude-3-haiku",
@@ -293,20 +366,31 @@ else:
 api_key = st.session_state["api_key"]
 agent_id = st.session_state["agent_id"]
 
-client = ElevenLabs(api_key=api_key)
-
-
 elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
 ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# Loads the configured models in the background and keeps them resident, so the
+# first summary does not wait for a cold model; started once per process.
+model_manager = start_model_warmup(ollama_base_url)
+# Processes used to extract long PDFs; short ones are always read in-process.
+extraction_workers = int(os.getenv("EXTRACTION_WORKERS", "1"))
 
 api_key = os.getenv
 
 
-client = ElevenLabs(api_key=elevenlabs_api_key)
 with st.sidebar:
     st.title("ThoughtScribe")
     st.info("Turn your documents into insightful conversations and audio experiences with ThoughtScribe.")
     view_mode = st.radio("Choose the view mode:", ["Notes to Speech", "After Class Venting"])
+    with st.expander("Models"):
+        warmup_stats = model_manager.get_warmup_stats()
+        for model in model_manager.preload_models():
+            stats = warmup_stats.get(model, {"status": "queued"})
+            if stats["status"] == "ready":
+                st.caption(f"{model}: ready (load {stats['load_seconds']:.1f}s, warm-up {stats['seconds']:.1f}s)")
+            elif stats["status"] == "failed":
+                st.caption(f"{model}: failed to load ({stats.get('error')})")
+            else:
+                st.caption(f"{model}: {stats['status']}")
 
 col1, col2 = st.columns([1, 3])
 with col1:
@@ -320,89 +404,261 @@ st.markdown("---")
 
 
 if view_mode == "Notes to Speech":
+    from text_extraction import extract_to_store
+    from retrieval import get_retrieval_index
+
     st.header("Text Processing and Voice Generation")
+    client = get_elevenlabs_client(elevenlabs_api_key)
 
     uploaded_file = st.file_uploader("Upload a PDF file", type=["pdf"])
     if uploaded_file:
-        file_path = save_uploaded_file(uploaded_file)
-        extracted_text = extract_text_from_pdf(file_path)
-        st.text_area("Extracted Text", value=extracted_text, height=200)
-        
-        voice_name = st.selectbox("Choose a voice", [v["Name"] for v in get_voices(client)])
+        document_digest = get_upload_digest(uploaded_file)
+        if not has_artifact(document_digest, PAGE_INDEX_ARTIFACT):
+            extraction_progress = st.progress(0.0, text="Extracting text...")
+            extraction_preview = st.empty()
+            preview_pages = []
+
+            def show_extraction_progress(extracted, page_count, page_text):
+                extraction_progress.progress(
+                    extracted / max(page_count, 1),
+                    text=f"Extracted page {extracted} of {page_count}"
+                )
+                # Pages arrive in order while later ones are still being extracted, so
+                # the first pages are on screen before the whole document is done.
+                if extracted <= 3:
+                    preview_pages.append(page_text)
+                    extraction_preview.text("".join(preview_pages))
+
+            extract_to_store(document_digest, workers=extraction_workers, on_page=show_extraction_progress)
+            extraction_progress.empty()
+            extraction_preview.empty()
+        page_count = load_document_page_index(document_digest)["pages"]
+        last_page = max(page_count, 1)
+
+        # Only the pages on screen are read from the store and sent to the browser.
+        view_start = st.number_input(
+            f"Page (of {page_count})", min_value=1, max_value=last_page, value=1,
+            key=f"view_page_{document_digest}"
+        )
+        view_stop = min(view_start - 1 + PAGES_PER_VIEW, page_count)
+        st.text_area(
+            f"Extracted Text (pages {view_start}-{view_stop})",
+            value="".join(load_document_pages(document_digest, view_start - 1, view_stop)),
+            height=300
+        )
+
+        # Summaries and speech can cover a page range; the text comes from the page
+        # index, so nothing is extracted again.
+        range_col1, range_col2 = st.columns(2)
+        range_first = range_col1.number_input(
+            "From page", min_value=1, max_value=last_page, value=1, key=f"range_first_{document_digest}"
+        )
+        range_last = range_col2.number_input(
+            "To page", min_value=1, max_value=last_page, value=last_page, key=f"range_last_{document_digest}"
+        )
+        range_first, range_last = sorted((range_first, range_last))
+        selected_pages = None if (range_first, range_last) == (1, last_page) else [range_first - 1, range_last]
+        range_parts = [page_range_label(selected_pages)] if selected_pages else []
+        st.caption(f"Summaries and speech cover pages {range_first}-{range_last}.")
+        summary_name = summary_artifact(selected_pages)
+
+        if st.button("Refresh voices"):
+            get_voices(client, refresh=True)
+        voice_names = [v["Name"] for v in get_voices(client)]
+        voice_name = st.selectbox("Choose a voice", voice_names)
         
-        if "summary" not in st.session_state:
-            st.session_state["summary"] = None  
+        # A document (or page range) processed before brings its summary back from the store.
+        if st.session_state.get("summary_key") != [document_digest, summary_name]:
+            st.session_state["summary_key"] = [document_digest, summary_name]
+            st.session_state["summary"] = load_artifact(document_digest, summary_name)
+        if st.session_state["summary"]:
+            st.text_area("Saved Summary", value=st.session_state["summary"], height=150)
         
+        stage_labels = {"map": "Summarizing sections", "reduce": "Combining summaries", "speech": "Synthesized segment"}
+
+        def follow_job(job, label, show_partial=False):
+            """
+            Polls a background job until it finishes, showing its progress. The job
+            keeps running if the page reruns or reloads; the next run picks it up again.
+            """
+            if st.button("Cancel", key=f"cancel_{job['id']}"):
+                job_queue.cancel(job["id"])
+            job_progress = st.progress(0.0, text=label)
+            partial_output = st.empty()
+            while job["status"] not in FINISHED_STATUSES:
+                progress = job.get("progress")
+                if progress and progress["total"]:
+                    job_progress.progress(
+                        progress["completed"] / progress["total"],
+                        text=f"{stage_labels.get(progress['stage'], label)}: {progress['completed']} of {progress['total']}"
+                    )
+                if show_partial and job.get("partial"):
+                    partial_output.markdown(job["partial"])
+                time.sleep(JOB_POLL_INTERVAL)
+                job = job_queue.get(job["id"])
+            job_progress.empty()
+            partial_output.empty()
+            return job
+
+        def report_finished_job(job, error_label):
+            """Shows a job's outcome once per session; returns True if it completed."""
+            reported = st.session_state.setdefault("reported_jobs", set())
+            if job["id"] in reported:
+                return False
+            reported.add(job["id"])
+            if job["status"] == FAILED:
+                st.error(f"{error_label}: {job['error']}")
+            elif job["status"] == CANCELLED:
+                st.info("The job was cancelled.")
+            return job["status"] == COMPLETED
+
+        def show_audio(path, label, file_name):
+            if os.path.getsize(path) > AUDIO_INLINE_MAX_BYTES:
+                # Published under static/ (a hard link, so no second copy where the
+                # filesystem allows it) and streamed from disk by Streamlit.
+                static_name = f"{document_digest}-{os.path.basename(path)}"
+                static_path = os.path.join(STATIC_AUDIO_DIR, static_name)
+                if os.path.exists(static_path):
+                    notify_access(static_path)
+                else:
+                    ensure_data_dirs()
+                    try:
+                        os.link(path, static_path)
+                    except OSError:
+                        shutil.copyfile(path, static_path)
+                    notify_write(static_path)
+                st.markdown(f'<a href="app/static/audio/{static_name}" download="{file_name}">{label}</a>',
+                            unsafe_allow_html=True)
+                st.caption("This audio is too long to play in the page; download it to listen.")
+                return
+            # Streamlit 1.25 serves media from memory, so the file has to be read
+            # whole once here. Both widgets get the same bytes and MIME type, which
+            # Streamlit stores as a single media file instead of two copies.
+            with open(path, "rb") as audio_file:
+                audio_bytes = audio_file.read()
+            st.download_button(label=label, data=audio_bytes, file_name=file_name, mime="audio/mpeg")
+            st.audio(audio_bytes, format="audio/mpeg")
+
         if st.button("Summarize"):
-            
-            try:
-                from ollama_integration import OllamaIntegration
-                ollama_client = OllamaIntegration(base_url=ollama_base_url)
-                with st.spinner("Generating summary..."):
-                    summary = ollama_client.summarize_text(extracted_text)
+            job_queue.submit("summarize", {"digest": document_digest, "base_url": ollama_base_url, "pages": selected_pages})
+
+        summary_job = job_queue.find_latest("summarize", digest=document_digest, pages=selected_pages)
+        if summary_job:
+            if summary_job["status"] not in FINISHED_STATUSES:
+                summary_job = follow_job(summary_job, "Generating summary...", show_partial=True)
+            if report_finished_job(summary_job, "An error occurred while summarizing"):
+                summary = load_artifact(document_digest, summary_name)
                 st.session_state["summary"] = summary 
                 st.text_area("Summary", value=summary, height=150)
-            except Exception as e:
-                st.error(f"An error occurred while summarizing: {e}")
+                stats = summary_job["result"].get("stream_stats")
+                if stats and stats["time_to_first_token"] is not None:
+                    tokens_per_second = f"{stats['tokens_per_second']:.1f}" if stats["tokens_per_second"] else "n/a"
+                    st.caption(
+                        f"First token after {stats['time_to_first_token']:.2f}s, "
+                        f"{tokens_per_second} tokens/s"
+                    )
+                summary_stats = summary_job["result"].get("summary_stats")
+                if summary_stats and summary_stats["cached_prompts"]:
+                    st.caption(
+                        f"Reused {summary_stats['cached_prompts']} of "
+                        f"{summary_stats['cached_prompts'] + summary_stats['sent_prompts']} summary steps "
+                        f"(about {summary_stats['cached_prompt_tokens']} prompt tokens not sent to Ollama)"
+                    )
         voice_name_summary = st.selectbox(
             "Choose a voice for summary", 
-            [v["Name"] for v in get_voices(client)], 
+            voice_names, 
             key="summary_voice_select_key"
         )
-    
+        summary_audio_name = artifact_name("summary_audio", voice_name_summary, *range_parts)
+        speech_name = artifact_name("speech", voice_name, *range_parts)
+        speech_secrets = {"api_key": elevenlabs_api_key}
+
         if st.button("Generate Speech for Summary"):
             if st.session_state["summary"]:
-                with st.spinner("Converting summary to audio..."):
-                    try:
-                        voice_name = st.selectbox(
-                            "Choose a voice for summary", 
-                            [v["Name"] for v in get_voices(client)], 
-                            key="summary_voice_select" 
-                        )
-                        summary_audio = generate_speech(client, st.session_state["summary"], voice_name)
-                        summary_audio = b"".join(summary_audio)  
-                        
-                        st.download_button(
-                            label="Download Summary Audio",
-                            data=io.BytesIO(summary_audio),
-                            file_name="summary_audio.mp3",
-                            mime="audio/mpeg"
-                        )
-                        st.audio(summary_audio, format="audio/mp3")
-                    except Exception as e:
-                        st.error(f"An error occurred while generating speech: {e}")
+                if has_artifact(document_digest, summary_audio_name):
+                    show_audio(artifact_path(document_digest, summary_audio_name), "Download Summary Audio", "summary_audio.mp3")
+                else:
+                    job_queue.submit("speech", {
+                        "digest": document_digest,
+                        "source": summary_name,
+                        "voice_name": voice_name_summary,
+                        "artifact": summary_audio_name,
+                    }, secrets=speech_secrets)
             else:
                 st.warning("Please generate a summary first.")
 
+        summary_speech_job = job_queue.find_latest("speech", digest=document_digest, artifact=summary_audio_name)
+        if summary_speech_job:
+            if summary_speech_job["status"] not in FINISHED_STATUSES:
+                summary_speech_job = follow_job(summary_speech_job, "Converting summary to audio...")
+            if report_finished_job(summary_speech_job, "An error occurred while generating speech"):
+                show_audio(artifact_path(document_digest, summary_audio_name), "Download Summary Audio", "summary_audio.mp3")
+
+        speech_params = {
+            "digest": document_digest,
+            "source": TEXT_ARTIFACT,
+            "voice_name": voice_name,
+            "artifact": speech_name,
+            "intro": "This audio is brought to you by ThoughtScribe, powered by ElevenLabs.",
+            "pages": selected_pages,
+        }
         if st.button("Generate Speech"):
-            with st.spinner("Converting text to audio. Please wait..."):
-                try:
-                    voice_name = st.selectbox(
-                        "Choose a voice for full text", 
-                        [v["Name"] for v in get_voices(client)], 
-                        key="full_text_voice_select"  
-                    )
-                    branding_intro = "This audio is brought to you by ThoughtScribe, powered by ElevenLabs."
-                    branding_audio = generate_speech(client, branding_intro, voice_name)
-                    branding_audio = b"".join(branding_audio)
-
-                    user_audio = generate_speech(client, extracted_text, voice_name)
-                    user_audio = b"".join(user_audio)
-
-                    complete_audio = branding_audio + user_audio
-
-                    st.download_button(
-                        label="Download Audio",
-                        data=complete_audio,
-                        file_name="final_output.mp3",
-                        mime="audio/mpeg"
+            if has_artifact(document_digest, speech_name):
+                show_audio(artifact_path(document_digest, speech_name), "Download Audio", "final_output.mp3")
+            else:
+                job_queue.submit("speech", speech_params, secrets=speech_secrets)
+
+        speech_job = job_queue.find_latest("speech", digest=document_digest, artifact=speech_name)
+        if speech_job:
+            if speech_job["status"] not in FINISHED_STATUSES:
+                speech_job = follow_job(speech_job, "Converting text to audio. Please wait...")
+            if report_finished_job(speech_job, "An error occurred"):
+                show_audio(artifact_path(document_digest, speech_name), "Download Audio", "final_output.mp3")
+            # Segments that finished are in the audio cache, so a retry only
+            # synthesizes the ones that failed.
+            if speech_job["status"] == FAILED and st.button("Retry failed segments"):
+                job_queue.submit("speech", speech_params, secrets=speech_secrets)
+
+        # Every upload is added to the notes index in the background; questions are
+        # answered from the closest chunks of all indexed notes.
+        st.subheader("Ask Your Notes")
+        notes_index = get_retrieval_index(ollama_base_url)
+        index_params = {"digest": document_digest, "base_url": ollama_base_url}
+        index_job = job_queue.find_latest("index", digest=document_digest)
+        if not notes_index.has_document(document_digest):
+            if index_job is None or index_job["status"] == COMPLETED:
+                job_queue.submit("index", index_params)
+                index_job = job_queue.find_latest("index", digest=document_digest)
+            if index_job["status"] in (FAILED, CANCELLED):
+                if index_job["status"] == FAILED:
+                    st.warning(f"This document could not be indexed: {index_job['error']}")
+                else:
+                    st.warning("Indexing this document was cancelled, so questions cannot search it yet.")
+                if st.button("Retry indexing"):
+                    job_queue.submit("index", index_params)
+            elif index_job["status"] not in FINISHED_STATUSES:
+                st.caption("Indexing this document for questions...")
+        question = st.text_input("Ask a question about your notes")
+        this_document_only = st.checkbox("Only search this document")
+        if st.button("Ask") and question:
+            from ollama_integration import OllamaIntegration
+            try:
+                with st.spinner("Searching your notes..."):
+                    answer = OllamaIntegration(base_url=ollama_base_url).answer_question(
+                        question, digests=[document_digest] if this_document_only else None
                     )
-                except Exception as e:
-                    st.error(f"An error occurred: {e}")
+                st.markdown(answer["answer"])
+                with st.expander("Sources"):
+                    for source in answer["sources"]:
+                        st.caption(f"{source['name'] or 'Document'}, page {source['page']} (similarity {source['score']:.2f})")
+                        st.text(source["text"])
+            except Exception as e:
+                st.error(f"An error occurred while answering: {e}")
 
 if view_mode == "After Class Venting":
     st.header("ThoughtScribe Friend")
     st.caption("Come talk or vent about school work after studying.")
+    from transcript_events import TranscriptBus, follow_transcript, render_transcript
     if st.button("Create New Agent"):
             agent_setup()
     if "conversation" not in st.session_state:
@@ -417,18 +673,26 @@ if view_mode == "After Class Venting":
                 st.error("Missing API key or Agent ID. Please check your .env file.")
                 st.stop()
 
-            client = ElevenLabs(api_key=api_key)
+            from elevenlabs.conversational_ai.conversation import Conversation
+            from elevenlabs.conversational_ai.default_audio_interface import DefaultAudioInterface
+
+            client = create_elevenlabs_client(api_key)
             status_message = st.empty() 
             status_message.write("Initializing Conversation...")
 
+            # The callbacks run on the Conversation's audio threads, so they only
+            # push into the bus; the transcript is drawn and saved from elsewhere.
+            transcript_bus = TranscriptBus(f"venting_{st.session_state['session_id']}_{int(time.time())}")
+
             conversation = Conversation(
                 client=client,
                 agent_id=agent_id,
                 requires_auth=bool(api_key),
                 audio_interface=DefaultAudioInterface(),
-                callback_agent_response=lambda response: st.write(f"**Agent:** {response}"),
-                callback_user_transcript=lambda transcript: st.write(f"**You:** {transcript}"),
+                callback_agent_response=transcript_bus.callback("Agent"),
+                callback_user_transcript=transcript_bus.callback("You"),
             )
+            st.session_state["transcript_bus"] = transcript_bus.start()
             conversation.start_session()
             status_message.empty()  
             st.success("Conversation started! Speak into your microphone.")
@@ -456,6 +720,15 @@ if view_mode == "After Class Venting":
 
         except Exception as e:
             st.error(f"Failed to end the conversation: {e}")
+        finally:
+            transcript_bus = st.session_state.pop("transcript_bus", None)
+            if transcript_bus:
+                transcript_bus.close()
+                st.markdown(render_transcript(transcript_bus.recent()))
+
+    if st.session_state["conversation"] and st.session_state.get("transcript_bus"):
+        # Redraws new turns in batches until a button click reruns the script.
+        follow_transcript(st.session_state["transcript_bus"], st.empty())
 
 
 st.markdown("---")
@@ -0,0 +1,155 @@
+# Developer: Eric Neftali Paiz
+import logging
+import os
+import threading
+import time
+from http_transport import post
+from instrumentation import log_event, metrics, span
+
+# Which Ollama model handles which kind of work. High-volume, short tasks (chunk
+# summaries, sentiment, folding chat history) go to the small tier; the pass whose output the user
+# reads (final summary, notes) goes to the large tier. All tiers default to
+# OLLAMA_MODEL, so nothing changes until the tier variables are set.
+DEFAULT_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
+MODEL_TIERS = {
+    "small": os.getenv("OLLAMA_MODEL_SMALL", DEFAULT_MODEL),
+    "default": DEFAULT_MODEL,
+    "large": os.getenv("OLLAMA_MODEL_LARGE", DEFAULT_MODEL),
+}
+TASK_TIERS = {
+    "chat": "default",
+    "summary_map": "small",
+    "summary_combine": "small",
+    "summary_final": "large",
+    "sentiment": "small",
+    "notes": "large",
+    "analysis": "large",
+    "history_summary": "small",
+    "answer": "default",
+}
+# Overrides as "task=tier" pairs, e.g. OLLAMA_TASK_TIERS="sentiment=default,notes=default".
+for _pair in filter(None, os.getenv("OLLAMA_TASK_TIERS", "").split(",")):
+    _task, _, _tier = _pair.partition("=")
+    TASK_TIERS[_task.strip()] = _tier.strip()
+
+# How long Ollama keeps a model in memory after a request: a duration such as
+# "30m", or -1 to keep it loaded until the server stops.
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Models loaded at start-up; defaults to every model a tier uses.
+PRELOAD_MODELS = [name.strip() for name in os.getenv("OLLAMA_PRELOAD", "").split(",") if name.strip()]
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def _keep_alive_value(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class ModelManager:
+    """
+    Routes task types to model tiers and keeps those models loaded on one Ollama host.
+
+    Warm-up sends each model an empty chat request, which makes Ollama load it and
+    pin it for keep_alive without generating anything. The outcome per model is kept
+    in warmup_stats: status ("loading", "ready" or "failed"), seconds (wall time) and
+    load_seconds (as reported by Ollama).
+    """
+
+    def __init__(self, base_url, tiers=None, task_tiers=None, keep_alive=KEEP_ALIVE):
+        self.base_url = base_url
+        self.tiers = dict(tiers or MODEL_TIERS)
+        self.task_tiers = dict(task_tiers or TASK_TIERS)
+        self.keep_alive = _keep_alive_value(keep_alive)
+        self.warmup_stats = {}
+        self._warmup_thread = None
+        self._lock = threading.Lock()
+
+    def model_for(self, task="chat"):
+        """
+        Returns the model configured for a task type. Unknown tasks and tiers fall
+        back to the default tier.
+        """
+        tier = self.task_tiers.get(task, "default")
+        return self.tiers.get(tier) or self.tiers["default"]
+
+    def models(self):
+        """Every distinct model a tier uses, small tier first."""
+        return list(dict.fromkeys(self.tiers[tier] for tier in ("small", "default", "large") if tier in self.tiers))
+
+    def preload_models(self):
+        """The models warmed up at start-up: OLLAMA_PRELOAD, or every tier's model."""
+        return PRELOAD_MODELS or self.models()
+
+    def warm_up_model(self, model):
+        """
+        Loads a model and pins it for keep_alive.
+
+        Returns:
+            dict: The model's warm-up stats.
+        """
+        with self._lock:
+            self.warmup_stats[model] = {"status": "loading", "seconds": None, "load_seconds": None}
+        started = time.perf_counter()
+        payload = {"model": model, "messages": [], "keep_alive": self.keep_alive, "stream": False}
+        try:
+            with span("ollama.warm_up", model=model) as current:
+                response = post(f"{self.base_url}/api/chat", json=payload, retries=1)
+                if response.status_code != 200:
+                    raise RuntimeError(f"Failed to load model '{model}': {response.text}")
+                load_seconds = response.json().get("load_duration", 0) / 1e9
+                current.set_tag(load_seconds=round(load_seconds, 3))
+            stats = {"status": "ready", "seconds": time.perf_counter() - started, "load_seconds": load_seconds}
+            metrics.observe("thoughtscribe_ollama_model_load_seconds", load_seconds, model=model)
+        except Exception as e:
+            stats = {"status": "failed", "seconds": time.perf_counter() - started, "load_seconds": None, "error": str(e)}
+            log_event("Model warm-up failed", logging.WARNING, model=model, error=str(e))
+        with self._lock:
+            self.warmup_stats[model] = stats
+        return stats
+
+    def warm_up(self, models=None):
+        """
+        Loads models one after another (Ollama loads them serially anyway).
+
+        Returns:
+            dict: Model name -> warm-up stats.
+        """
+        for model in models or self.preload_models():
+            self.warm_up_model(model)
+        return self.get_warmup_stats()
+
+    def start_warm_up(self, models=None):
+        """Warms models up on a background thread, once per manager."""
+        with self._lock:
+            if self._warmup_thread is None:
+                self._warmup_thread = threading.Thread(
+                    target=self.warm_up, args=(models,), name="model-warmup", daemon=True
+                )
+                self._warmup_thread.start()
+        return self
+
+    def get_warmup_stats(self):
+        with self._lock:
+            return {model: dict(stats) for model, stats in self.warmup_stats.items()}
+
+
+def get_model_manager(base_url):
+    """Returns the process-wide ModelManager for an Ollama host."""
+    with _managers_lock:
+        manager = _managers.get(base_url)
+        if manager is None:
+            manager = ModelManager(base_url)
+            _managers[base_url] = manager
+        return manager
+
+
+def start_model_warmup(base_url):
+    """
+    Starts preloading the configured models on a background thread, once per
+    process and host, so the first request after start-up does not pay the load.
+    """
+    return get_model_manager(base_url).start_warm_up()
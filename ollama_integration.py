@@ -1,106 +1,805 @@
 # Developer: Eric Neftali Paiz
-import requests
 import os
-from elevenlabs import ElevenLabs, Voice, VoiceSettings
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from elevenlabs import Voice, VoiceSettings
+from http_transport import create_elevenlabs_client, post
+from instrumentation import bind, log_event, metrics, span
+from model_manager import get_model_manager
+from storage_janitor import data_dir, ensure_data_dirs, notify_access, notify_write
+from text_chunking import chunk_text, estimate_tokens
+from voice_generation import get_voice_id
+
+MAP_PROMPT = "Please summarize the following section of a longer document:"
+COMBINE_PROMPT = "Combine the following partial summaries of one document into a single summary:"
+SUMMARY_PROMPT = "Please summarize the following text:"
+SENTIMENT_PROMPT = "Analyze the sentiment of the following text:"
+NOTES_PROMPT = "Generate detailed notes on the following text:"
+# For documents over one prompt, analyze_document derives sentiment and notes from
+# the partial summaries of its map phase instead of mapping every chunk again.
+SENTIMENT_FROM_SUMMARIES_PROMPT = (
+    "Analyze the overall sentiment and tone of a document from the following summaries of its parts:"
+)
+NOTES_FROM_SUMMARIES_PROMPT = "Generate detailed notes on a document from the following summaries of its parts:"
+
+# analyze_document asks for all three analyses in one request, with the reply held to
+# this JSON schema (Ollama structured outputs, 0.5+). Set OLLAMA_STRUCTURED_ANALYSIS=false
+# for models that do not follow it; replies that do not parse fall back anyway.
+ANALYSIS_FIELDS = ("summary", "sentiment", "notes")
+ANALYSIS_PROMPT = (
+    "Analyze the following text. Reply in JSON with a concise summary, the overall sentiment "
+    "and tone with a short justification, and detailed notes as a bulleted list:"
+)
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {field: {"type": "string"} for field in ANALYSIS_FIELDS},
+    "required": list(ANALYSIS_FIELDS),
+}
+STRUCTURED_ANALYSIS = os.getenv("OLLAMA_STRUCTURED_ANALYSIS", "true").strip().lower() in ("1", "true", "yes")
+
+# Summaries of every map, combine and final prompt are kept on disk keyed by model
+# and prompt text, so a revised upload only sends the prompts whose text changed.
+# The janitor keeps the directory within SUMMARY_CACHE_QUOTA_MB.
+SUMMARY_CACHE_DIR = data_dir("data/summary_cache")
+# About one page in PAGE_GROUP_BOUNDARY ends a summary chunk because of its hash
+# alone (see group_pages).
+PAGE_GROUP_BOUNDARY = 4
+
+ANSWER_PROMPT = (
+    "Answer the question using only the numbered excerpts from the user's notes below. "
+    "Cite the excerpts you use by number, and say so if they do not contain the answer."
+)
+
+
+def needs_reduction(summaries, max_tokens):
+    return len(summaries) > 1 and estimate_tokens("\n\n".join(summaries)) > max_tokens
+
+
+def group_summaries(summaries, max_tokens):
+    """
+    Groups partial summaries into combine prompts that fit the token budget.
+
+    Returns:
+        list: Groups of joined summaries; always fewer than the summaries given.
+    """
+    groups = chunk_text("\n\n".join(summaries), max_tokens)
+    if len(groups) >= len(summaries):
+        # Each summary alone fills the budget; pair them up so the
+        # reduction still shrinks every round.
+        groups = ["\n\n".join(summaries[i:i + 2]) for i in range(0, len(summaries), 2)]
+    return groups
+
+
+def parse_analysis(reply):
+    """
+    Reads a structured analysis reply.
+
+    Returns:
+        dict | None: summary, sentiment and notes, or None if the reply is not
+            JSON with every field filled in.
+    """
+    try:
+        data = json.loads(reply)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    analysis = {}
+    for field in ANALYSIS_FIELDS:
+        value = data.get(field)
+        if isinstance(value, list):
+            value = "\n".join(f"- {item}" for item in value)
+        if not isinstance(value, str) or not value.strip():
+            return None
+        analysis[field] = value.strip()
+    return analysis
+
+
+def group_pages(pages, page_hashes, max_tokens):
+    """
+    Groups consecutive pages into summary chunks that fit the token budget.
+
+    A chunk also ends after any page whose hash is divisible by PAGE_GROUP_BOUNDARY,
+    so chunk boundaries depend on page content: an edit that changes a page's
+    length only regroups pages up to the next such page, and every chunk after it
+    has the same text, and so the same cached summary, as before. Pages over the
+    budget are split on their own.
+
+    Returns:
+        list: (first_page, chunk_text) pairs in document order, pages 0-based.
+    """
+    chunks = []
+    group, group_tokens, group_start = [], 0, 0
+
+    def close():
+        if group:
+            chunks.append((group_start, "".join(group)))
+        group.clear()
+
+    for number, (page_text, page_hash) in enumerate(zip(pages, page_hashes)):
+        tokens = estimate_tokens(page_text)
+        if tokens > max_tokens:
+            close()
+            chunks.extend((number, piece) for piece in chunk_text(page_text, max_tokens))
+            group_tokens = 0
+            continue
+        if group and group_tokens + tokens > max_tokens:
+            close()
+            group_tokens = 0
+        if not group:
+            group_start = number
+        group.append(page_text)
+        group_tokens += tokens
+        if int(page_hash[:8], 16) % PAGE_GROUP_BOUNDARY == 0:
+            close()
+            group_tokens = 0
+    close()
+    return chunks
+
+
+### Summary Cache ###
+def summary_cache_key(model, prompt):
+    return hashlib.sha256(json.dumps([model, prompt]).encode("utf-8")).hexdigest()
+
+
+def _summary_cache_path(key):
+    return os.path.join(SUMMARY_CACHE_DIR, f"{key}.txt")
+
+
+def load_cached_summary(key):
+    """Returns the cached reply for a key, or None on a miss."""
+    path = _summary_cache_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            summary = f.read()
+    except FileNotFoundError:
+        return None
+    notify_access(path)
+    return summary
+
+
+def save_cached_summary(key, summary):
+    ensure_data_dirs()
+    path = _summary_cache_path(key)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(summary)
+    os.replace(tmp_path, path)
+    notify_write(path)
 
 
 class OllamaIntegration:
-    def __init__(self, base_url="http://localhost:11434", elevenlabs_api_key=None):
-        print("Initializing OllamaIntegration...")
+    def __init__(self, base_url="http://localhost:11434", elevenlabs_api_key=None,
+                 summary_chunk_tokens=1500, max_concurrency=4, model_manager=None):
+        log_event("Initializing OllamaIntegration", base_url=base_url)
         self.base_url = base_url
+        # Picks the model for each task type and the keep_alive sent with every request.
+        self.models = model_manager or get_model_manager(base_url)
         self.session_id = None
-        self.elevenlabs_client = ElevenLabs(api_key=elevenlabs_api_key) if elevenlabs_api_key else None
+        self.elevenlabs_client = create_elevenlabs_client(elevenlabs_api_key) if elevenlabs_api_key else None
+        # Token budget for the text of one summarization prompt. Documents over it
+        # are summarized map-reduce style instead of in a single prompt.
+        self.summary_chunk_tokens = summary_chunk_tokens
+        self.max_concurrency = max_concurrency
+        # Caps blocking /api/chat requests in flight from this instance, however many
+        # threads send them (e.g. the three analyses of analyze_document, each with
+        # its own chunk pool).
+        self._request_slots = threading.Semaphore(max_concurrency)
+        self.last_stream_stats = None
+        self.last_summary_stats = None
+        self._cache_stats_lock = threading.Lock()
 
     
 
-    def send_prompt(self, prompt, model="llama3.2"):
-        print(f"Sending prompt to Ollama: {prompt[:50]}...")
+    def send_prompt(self, prompt, model=None, task="chat", format=None):
+        return self.send_messages([{"role": "user", "content": prompt}], model, task, format)
+
+    def send_messages(self, messages, model=None, task="chat", format=None):
+        """
+        Sends a native /api/chat message array (see util.prepare_ollama_messages).
+
+        Args:
+            messages (list): Chat messages.
+            model (str): Ollama model name; defaults to the model routed for task.
+            task (str): Task type used to pick the model (see model_manager.TASK_TIERS).
+            format: Optional "json" or a JSON schema the reply must follow.
+
+        Returns:
+            str: The assistant's reply.
+        """
+        model = model or self.models.model_for(task)
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": False,
+            "keep_alive": self.models.keep_alive
+        }
+        if format:
+            payload["format"] = format
+        with self._request_slots, span("ollama.chat", model=model, task=task, messages=len(messages),
+                                       prompt_chars=sum(len(message["content"]) for message in messages)) as current:
+            response = post(f"{self.base_url}/api/chat", json=payload)
+            current.set_tag(http_status=response.status_code)
+            if response.status_code == 200:
+                body = response.json()
+                if "eval_count" in body:
+                    current.set_tag(eval_count=body["eval_count"])
+                    metrics.inc("thoughtscribe_ollama_eval_tokens_total", body["eval_count"], model=model)
+                return body.get("message", {}).get("content", "No response received.")
+            else:
+                raise RuntimeError(f"Failed to send prompt: {response.text}")
+
+    def stream_prompt(self, prompt, model=None, task="chat"):
+        """
+        Sends a prompt to /api/chat with streaming on and yields the reply as it arrives.
+
+        Once the stream finishes, timing for the call is available in
+        self.last_stream_stats: time_to_first_token (s), total_time (s),
+        eval_count and tokens_per_second.
+
+        Args:
+            prompt (str): The user prompt.
+            model (str): Ollama model name; defaults to the model routed for task.
+            task (str): Task type used to pick the model.
+
+        Yields:
+            str: Pieces of the reply text.
+        """
+        model = model or self.models.model_for(task)
         payload = {
             "model": model,
-            "messages": [{"role": "user", "content": prompt}],  # For /api/chat
-            "stream": False
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True,
+            "keep_alive": self.models.keep_alive
         }
-        response = requests.post(f"{self.base_url}/api/chat", json=payload)
-        if response.status_code == 200:
-            return response.json().get("message", {}).get("content", "No response received.")
-        else:
-            print(f"Error sending prompt: {response.text}")
-            raise RuntimeError(f"Failed to send prompt: {response.text}")
+        started = time.perf_counter()
+        first_token_at = None
+        pieces = 0
+        final = {}
+        with span("ollama.chat_stream", model=model, task=task, prompt_chars=len(prompt)) as current, \
+                post(f"{self.base_url}/api/chat", json=payload, stream=True) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"Failed to send prompt: {response.text}")
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise RuntimeError(f"Failed to send prompt: {chunk['error']}")
+                content = chunk.get("message", {}).get("content", "")
+                if content:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        current.set_tag(time_to_first_token=round(first_token_at - started, 4))
+                    pieces += 1
+                    yield content
+                if chunk.get("done"):
+                    final = chunk
+                    break
+            current.set_tag(eval_count=final.get("eval_count", pieces))
+        total_time = time.perf_counter() - started
+        # Ollama reports eval_count/eval_duration (ns) on the final chunk; fall back
+        # to counting streamed pieces if the server left them out.
+        eval_count = final.get("eval_count", pieces)
+        eval_seconds = final.get("eval_duration", 0) / 1e9
+        if not eval_seconds and first_token_at is not None:
+            eval_seconds = time.perf_counter() - first_token_at
+        self.last_stream_stats = {
+            "time_to_first_token": (first_token_at - started) if first_token_at is not None else None,
+            "total_time": total_time,
+            "eval_count": eval_count,
+            "tokens_per_second": eval_count / eval_seconds if eval_seconds else None,
+        }
+        metrics.inc("thoughtscribe_ollama_eval_tokens_total", eval_count, model=model)
+
+
+    def summarize_text(self, text, progress_callback=None):
+        """
+        Summarizes text, splitting it into chunks when it does not fit one prompt.
+
+        Args:
+            text (str): The text to summarize.
+            progress_callback: Optional callable(stage, completed, total) called as
+                chunks finish. Stages are "map" and "reduce".
+
+        Returns:
+            str: The summary.
+        """
+        with span("ollama.summarize", chars=len(text)):
+            if estimate_tokens(text) <= self.summary_chunk_tokens:
+                summary_prompt = f"Please summarize the following text:\n{text}"
+                summary = self.send_prompt(summary_prompt, task="summary_final")
+                if progress_callback:
+                    progress_callback("reduce", 1, 1)
+                return summary
+            return self.map_reduce_summarize(text, progress_callback)
+
+    def _summarize_chunks(self, chunks, prompt, stage, progress_callback=None, task="summary_map", cache_stats=None):
+        """
+        Summarizes chunks concurrently, returning summaries in chunk order. With
+        cache_stats, replies come from the summary cache where possible.
+        """
+        results = [None] * len(chunks)
+        pool = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        send = self.send_prompt if cache_stats is None else self._cached_sender(cache_stats)
+        try:
+            futures = {
+                pool.submit(bind(send), f"{prompt}\n{chunk}", task=task): index
+                for index, chunk in enumerate(chunks)
+            }
+            for completed, future in enumerate(as_completed(futures), start=1):
+                results[futures[future]] = future.result()
+                if progress_callback:
+                    progress_callback(stage, completed, len(chunks))
+        except BaseException:
+            # A failed chunk or a callback that raises (e.g. to cancel) drops the
+            # chunks that have not started yet.
+            pool.shutdown(cancel_futures=True)
+            raise
+        finally:
+            pool.shutdown()
+        return results
+
+    def _reduce_summaries(self, text, progress_callback=None):
+        """
+        Summarizes each chunk of text, then summarizes groups of those summaries
+        until what is left fits a single prompt.
+
+        Returns:
+            list: The remaining partial summaries, in document order.
+        """
+        chunks = chunk_text(text, self.summary_chunk_tokens)
+        log_event("Map-reduce summarization", chunks=len(chunks))
+        summaries = self._summarize_chunks(chunks, MAP_PROMPT, "map", progress_callback)
+        while needs_reduction(summaries, self.summary_chunk_tokens):
+            groups = group_summaries(summaries, self.summary_chunk_tokens)
+            summaries = self._summarize_chunks(groups, COMBINE_PROMPT, "reduce", progress_callback,
+                                               task="summary_combine")
+        return summaries
+
+    def map_reduce_summarize(self, text, progress_callback=None):
+        """
+        Summarizes a long document by summarizing each chunk, then repeatedly
+        summarizing groups of those summaries until a single one remains.
+
+        Args:
+            text (str): The text to summarize.
+            progress_callback: Optional callable(stage, completed, total).
+
+        Returns:
+            str: The final summary.
+        """
+        summaries = self._reduce_summaries(text, progress_callback)
+        if len(summaries) <= 1:
+            return summaries[0] if summaries else ""
+        summary = self.send_prompt(f"{COMBINE_PROMPT}\n" + "\n\n".join(summaries), task="summary_final")
+        if progress_callback:
+            progress_callback("reduce", 1, 1)
+        return summary
 
+    def _count_cached(self, cache_stats, result, prompt):
+        with self._cache_stats_lock:
+            cache_stats[f"{result}_prompts"] += 1
+            cache_stats[f"{result}_prompt_tokens"] += estimate_tokens(prompt)
+        metrics.inc("thoughtscribe_summary_cache_total", result=result)
 
-    def summarize_text(self, text):
-        print("Generating summary for provided text...")
-        summary_prompt = f"Please summarize the following text:\n{text}"
-        return self.send_prompt(summary_prompt)
+    def _cached_sender(self, cache_stats):
+        """
+        Returns a send_prompt(prompt, task) that answers from the summary cache when
+        it can, counting hits ("cached") and misses ("sent") in cache_stats.
+        """
+        def send(prompt, task="chat"):
+            key = summary_cache_key(self.models.model_for(task), prompt)
+            summary = load_cached_summary(key)
+            if summary is not None:
+                self._count_cached(cache_stats, "cached", prompt)
+                return summary
+            summary = self.send_prompt(prompt, task=task)
+            save_cached_summary(key, summary)
+            self._count_cached(cache_stats, "sent", prompt)
+            return summary
+        return send
 
+    def summarize_pages_stream(self, pages, page_hashes, progress_callback=None):
+        """
+        Summarizes a document page by page, reusing cached summaries for every part
+        whose text has been summarized before, e.g. the unchanged pages of a revised
+        upload. Pages are grouped into chunks with group_pages, and map, combine and
+        final prompts all go through the summary cache, so only chunks with changed
+        pages, and the combine steps above them, reach Ollama.
+
+        What was reused is left in self.last_summary_stats: chunks, cached_prompts,
+        sent_prompts, cached_prompt_tokens and sent_prompt_tokens.
+
+        Args:
+            pages (list): Page texts.
+            page_hashes (list): Content hash of each page (see text_extraction.hash_page).
+            progress_callback: Optional callable(stage, completed, total).
+
+        Yields:
+            str: Pieces of the summary; the whole summary at once when it is cached.
+        """
+        stats = {"chunks": 0, "cached_prompts": 0, "sent_prompts": 0,
+                 "cached_prompt_tokens": 0, "sent_prompt_tokens": 0}
+        self.last_summary_stats = stats
+        text = "".join(pages)
+        with span("ollama.summarize", chars=len(text), pages=len(pages), stream=True, incremental=True) as current:
+            if estimate_tokens(text) <= self.summary_chunk_tokens:
+                stats["chunks"] = 1
+                final_prompt = f"Please summarize the following text:\n{text}"
+            else:
+                chunks = group_pages(pages, page_hashes, self.summary_chunk_tokens)
+                stats["chunks"] = len(chunks)
+                summaries = self._summarize_chunks([chunk for _, chunk in chunks], MAP_PROMPT, "map",
+                                                   progress_callback, cache_stats=stats)
+                while needs_reduction(summaries, self.summary_chunk_tokens):
+                    groups = group_summaries(summaries, self.summary_chunk_tokens)
+                    summaries = self._summarize_chunks(groups, COMBINE_PROMPT, "reduce", progress_callback,
+                                                       task="summary_combine", cache_stats=stats)
+                if len(summaries) == 1:
+                    yield summaries[0]
+                    final_prompt = None
+                else:
+                    final_prompt = f"{COMBINE_PROMPT}\n" + "\n\n".join(summaries)
+            if final_prompt is not None:
+                key = summary_cache_key(self.models.model_for("summary_final"), final_prompt)
+                summary = load_cached_summary(key)
+                if summary is not None:
+                    self._count_cached(stats, "cached", final_prompt)
+                    yield summary
+                else:
+                    # The final summary is streamed as usual and cached once complete.
+                    summary = ""
+                    for piece in self.stream_prompt(final_prompt, task="summary_final"):
+                        summary += piece
+                        yield piece
+                    save_cached_summary(key, summary)
+                    self._count_cached(stats, "sent", final_prompt)
+            current.set_tag(**stats)
+        log_event("Incremental summarization", **stats)
+
+    def summarize_pages(self, pages, page_hashes, progress_callback=None):
+        """Non-streaming summarize_pages_stream; returns the summary."""
+        return "".join(self.summarize_pages_stream(pages, page_hashes, progress_callback))
+
+    def summarize_text_stream(self, text, progress_callback=None):
+        """
+        Streaming counterpart of summarize_text. Long documents are map-reduced as
+        usual and only the final combining prompt is streamed.
+
+        Yields:
+            str: Pieces of the summary as they arrive.
+        """
+        with span("ollama.summarize", chars=len(text), stream=True):
+            if estimate_tokens(text) <= self.summary_chunk_tokens:
+                yield from self.stream_prompt(f"Please summarize the following text:\n{text}", task="summary_final")
+                return
+            summaries = self._reduce_summaries(text, progress_callback)
+            if len(summaries) == 1:
+                yield summaries[0]
+                return
+            yield from self.stream_prompt(f"{COMBINE_PROMPT}\n" + "\n\n".join(summaries), task="summary_final")
+
+    def _run_concurrently(self, calls):
+        """Runs named zero-argument calls on their own threads, returning name -> result."""
+        with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+            futures = {name: pool.submit(bind(call)) for name, call in calls.items()}
+            return {name: future.result() for name, future in futures.items()}
+
+    def analyze_document(self, text, user_additions=None, progress_callback=None, structured=STRUCTURED_ANALYSIS):
+        """
+        Produces a summary, a sentiment analysis and notes for a document in one pass.
+
+        A document that fits one prompt is answered by a single structured-output
+        request (ANALYSIS_SCHEMA); if that is off or the reply is not valid JSON,
+        the three analyses are asked for concurrently on the text. Longer documents
+        are mapped once, as for a summary: each chunk is summarized and the partial
+        summaries are reduced until they fit one prompt. The final summary,
+        sentiment and notes are then written concurrently from those summaries, so
+        the whole pass costs one map phase plus one final step.
+
+        Args:
+            text (str): The document text.
+            user_additions (str): Optional instructions added to the notes prompts.
+            progress_callback: Optional callable(stage, completed, total). Stages are
+                "map" and "reduce".
+            structured (bool): Whether to try the single structured request.
+
+        Returns:
+            dict: summary, sentiment and notes (str), chunks (int), structured (bool,
+                whether the structured reply was used) and seconds (float).
+        """
+        started = time.perf_counter()
+        notes_prompt, notes_summaries_prompt, analysis_prompt = NOTES_PROMPT, NOTES_FROM_SUMMARIES_PROMPT, ANALYSIS_PROMPT
+        if user_additions:
+            notes_prompt = self.enhanced_user_prompt(notes_prompt, user_additions)
+            notes_summaries_prompt = self.enhanced_user_prompt(notes_summaries_prompt, user_additions)
+            analysis_prompt = self.enhanced_user_prompt(analysis_prompt, user_additions)
+        chunks = chunk_text(text, self.summary_chunk_tokens)
+        with span("ollama.analyze", chars=len(text), chunks=len(chunks)) as current:
+            analysis = None
+            if structured and len(chunks) == 1:
+                reply = self.send_prompt(f"{analysis_prompt}\n{chunks[0]}", task="analysis", format=ANALYSIS_SCHEMA)
+                analysis = parse_analysis(reply)
+                if analysis is None:
+                    log_event("Structured analysis reply was not valid JSON; running separate prompts", logging.WARNING)
+            used_structured = analysis is not None
+            current.set_tag(structured=used_structured)
+
+            if analysis is None and len(chunks) == 1:
+                analysis = self._run_concurrently({
+                    "summary": lambda: self.send_prompt(f"{SUMMARY_PROMPT}\n{chunks[0]}", task="summary_final"),
+                    "sentiment": lambda: self.send_prompt(f"{SENTIMENT_PROMPT}\n{chunks[0]}", task="sentiment"),
+                    "notes": lambda: self.send_prompt(f"{notes_prompt}\n{chunks[0]}", task="notes"),
+                })
+            elif analysis is None and chunks:
+                summaries = self._reduce_summaries(text, progress_callback)
+                joined = "\n\n".join(summaries)
+                calls = {
+                    "sentiment": lambda: self.send_prompt(f"{SENTIMENT_FROM_SUMMARIES_PROMPT}\n{joined}", task="sentiment"),
+                    "notes": lambda: self.send_prompt(f"{notes_summaries_prompt}\n{joined}", task="notes"),
+                }
+                if len(summaries) > 1:
+                    calls["summary"] = lambda: self.send_prompt(f"{COMBINE_PROMPT}\n{joined}", task="summary_final")
+                analysis = self._run_concurrently(calls)
+                analysis.setdefault("summary", summaries[0])
+            elif analysis is None:
+                analysis = {field: "" for field in ANALYSIS_FIELDS}
+            if progress_callback:
+                progress_callback("reduce", 1, 1)
+        analysis.update(chunks=len(chunks), structured=used_structured, seconds=time.perf_counter() - started)
+        return analysis
 
     def analyze_sentiment(self, text):
-        print("Performing sentiment analysis...")
-        sentiment_prompt = f"Analyze the sentiment of the following text:\n{text}"
-        return self.send_prompt(sentiment_prompt)
+        log_event("Performing sentiment analysis")
+        sentiment_prompt = f"{SENTIMENT_PROMPT}\n{text}"
+        return self.send_prompt(sentiment_prompt, task="sentiment")
+
+    def answer_question(self, question, index=None, top_k=None, digests=None):
+        """
+        Answers a question about the user's notes. Only the chunks the retrieval
+        index ranks closest to the question go into the prompt, not whole documents.
+
+        Args:
+            question (str): The question.
+            index: RetrievalIndex to search; defaults to the one for this Ollama host.
+            top_k (int): Number of chunks to include; defaults to RETRIEVAL_TOP_K.
+            digests: Optional documents to restrict the search to.
+
+        Returns:
+            dict: answer (str) and sources (the chunks used, see RetrievalIndex.search).
+        """
+        from retrieval import RETRIEVAL_TOP_K, get_retrieval_index
+
+        index = index or get_retrieval_index(self.base_url)
+        with span("ollama.answer", question_chars=len(question)) as current:
+            sources = index.search(question, top_k or RETRIEVAL_TOP_K, digests)
+            current.set_tag(sources=len(sources))
+            if not sources:
+                return {"answer": "There are no indexed notes to answer from yet.", "sources": []}
+            excerpts = "\n\n".join(
+                f"[{number}] ({source['name'] or 'document'}, page {source['page']})\n{source['text']}"
+                for number, source in enumerate(sources, start=1)
+            )
+            prompt = f"{ANSWER_PROMPT}\n\nExcerpts:\n{excerpts}\n\nQuestion: {question}"
+            answer = self.send_prompt(prompt, task="answer")
+        return {"answer": answer, "sources": sources}
 
     def enhanced_user_prompt(self, base_prompt, user_additions):
-        print("Enhancing prompt with user instructions...")
-        combined_prompt = f"{base_prompt}\n\nUser Additions: {user_additions}"
-        print(f"Generated combined prompt: {combined_prompt[:50]}...")
+        with span("prompt.build", kind="user_additions"):
+            combined_prompt = f"{base_prompt}\n\nUser Additions: {user_additions}"
         return combined_prompt
 
     def generate_notes_with_sentiment(self, text, user_additions=None):
-        print("Generating notes with sentiment analysis...")
-        sentiment = self.analyze_sentiment(text)
-        notes_prompt = f"Generate detailed notes based on the sentiment:\n{sentiment}"
-        if user_additions:
-            notes_prompt = self.enhanced_user_prompt(notes_prompt, user_additions)
-        return self.send_prompt(notes_prompt)
+        """
+        Returns notes on text. They come from one analyze_document pass rather than
+        a sentiment round trip followed by a notes one; call analyze_document directly
+        to keep the sentiment and summary as well.
+        """
+        log_event("Generating notes with sentiment analysis")
+        return self.analyze_document(text, user_additions)["notes"]
 
     def generate_audio_response(self, text, voice_name):
-        print(f"Generating audio response for text: {text[:50]}... using voice: {voice_name}")
         if not self.elevenlabs_client:
             raise ValueError("ElevenLabs API key is not configured.")
 
-        voices = self.elevenlabs_client.voices.get_all()
-        voice_id = next((v.voice_id for v in voices if v.name == voice_name), None)
+        voice_id = get_voice_id(self.elevenlabs_client, voice_name)
 
         if not voice_id:
-            print(f"Voice '{voice_name}' not found.")
             raise ValueError(f"Voice '{voice_name}' not found.")
 
         try:
-            audio = self.elevenlabs_client.generate(
-                text=text,
-                voice=Voice(
-                    voice_id=voice_id,
-                    settings=VoiceSettings(stability=0.7, similarity_boost=0.5)
+            with span("tts.generate", voice=voice_name, chars=len(text)):
+                audio = self.elevenlabs_client.generate(
+                    text=text,
+                    voice=Voice(
+                        voice_id=voice_id,
+                        settings=VoiceSettings(stability=0.7, similarity_boost=0.5)
+                    )
                 )
-            )
-            print("Audio generation successful.")
             return audio
         except Exception as e:
-            print(f"Error generating audio: {e}")
             raise RuntimeError(f"Failed to generate speech: {e}")
 
     def save_audio(self, audio, filename="response_audio.mp3"):
-        print(f"Saving audio to file: {filename}")
         output_dir = "data/audio"
         os.makedirs(output_dir, exist_ok=True)
         file_path = os.path.join(output_dir, filename)
 
         try:
-            with open(file_path, "wb") as f:
+            with span("file.write", path=file_path), open(file_path, "wb") as f:
                 f.write(audio)
-            print(f"Audio saved successfully at: {file_path}")
             return file_path
         except Exception as e:
-            print(f"Error saving audio: {e}")
             raise RuntimeError(f"Failed to save audio: {e}")
 
     def summarize_and_generate_audio(self, text, voice_name):
-        print("Summarizing text and generating audio...")
+        log_event("Summarizing text and generating audio", voice=voice_name)
         summary = self.summarize_text(text)
         audio = self.generate_audio_response(summary, voice_name)
         return summary, audio
 
 
+class AsyncOllamaIntegration:
+    """
+    asyncio counterpart of OllamaIntegration for running many prompts against one
+    Ollama host at once. Every call made through an instance shares one
+    concurrency limit. An instance belongs to the event loop it is first used on;
+    use it as an async context manager to close its connections.
+    """
+
+    def __init__(self, base_url="http://localhost:11434", summary_chunk_tokens=1500, max_concurrency=4,
+                 model_manager=None):
+        from ollama import AsyncClient
+        from http_transport import create_async_transport, httpx_timeout
+
+        self.base_url = base_url
+        self.models = model_manager or get_model_manager(base_url)
+        self.summary_chunk_tokens = summary_chunk_tokens
+        self.max_concurrency = max_concurrency
+        # The transport carries the shared retry policy; ollama passes it to httpx.
+        self._transport = create_async_transport()
+        self.client = AsyncClient(host=base_url, timeout=httpx_timeout(), transport=self._transport)
+        self._semaphore = None
+
+    def _limit(self):
+        # Created lazily so the semaphore binds to the loop the calls run on.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self._transport.aclose()
+
+    async def send_prompt(self, prompt, model=None, task="chat", format=None):
+        model = model or self.models.model_for(task)
+        async with self._limit():
+            try:
+                with span("ollama.chat", model=model, task=task, messages=1, prompt_chars=len(prompt), mode="async"):
+                    response = await self.client.chat(
+                        model=model,
+                        messages=[{"role": "user", "content": prompt}],
+                        keep_alive=self.models.keep_alive,
+                        format=format,
+                    )
+            except Exception as e:
+                raise RuntimeError(f"Failed to send prompt: {e}")
+        return response["message"]["content"] or "No response received."
+
+    async def batch(self, prompts, model=None, concurrency=None, task="chat"):
+        """
+        Sends many prompts concurrently and returns the replies in prompt order.
+
+        Args:
+            prompts (list): Prompts to send.
+            model (str): Ollama model name; defaults to the model routed for task.
+            concurrency (int): Optional tighter limit for this batch, on top of
+                the instance-wide max_concurrency.
+            task (str): Task type used to pick the model.
+
+        Returns:
+            list: Replies, one per prompt.
+        """
+        if concurrency is None:
+            return await asyncio.gather(*(self.send_prompt(prompt, model, task) for prompt in prompts))
+
+        batch_limit = asyncio.Semaphore(concurrency)
+
+        async def limited(prompt):
+            async with batch_limit:
+                return await self.send_prompt(prompt, model, task)
+
+        return await asyncio.gather(*(limited(prompt) for prompt in prompts))
+
+    async def summarize_text(self, text):
+        log_event("Generating summary (async)", chars=len(text))
+        if estimate_tokens(text) <= self.summary_chunk_tokens:
+            return await self.send_prompt(f"Please summarize the following text:\n{text}", task="summary_final")
+
+        summaries = await self._reduce_summaries(chunk_text(text, self.summary_chunk_tokens))
+        if len(summaries) <= 1:
+            return summaries[0] if summaries else ""
+        return await self.send_prompt(f"{COMBINE_PROMPT}\n" + "\n\n".join(summaries), task="summary_final")
+
+    async def _reduce_summaries(self, chunks):
+        """Summarizes each chunk, then groups of summaries until they fit one prompt."""
+        summaries = await self.batch([f"{MAP_PROMPT}\n{chunk}" for chunk in chunks], task="summary_map")
+        while needs_reduction(summaries, self.summary_chunk_tokens):
+            groups = group_summaries(summaries, self.summary_chunk_tokens)
+            summaries = await self.batch([f"{COMBINE_PROMPT}\n{group}" for group in groups], task="summary_combine")
+        return summaries
+
+    async def summarize_many(self, texts):
+        """
+        Summarizes several documents concurrently, e.g. a week of uploads.
+
+        Returns:
+            list: Summaries in the order the texts were given.
+        """
+        return await asyncio.gather(*(self.summarize_text(text) for text in texts))
+
+    async def analyze_sentiment(self, text):
+        log_event("Performing sentiment analysis (async)")
+        return await self.send_prompt(f"{SENTIMENT_PROMPT}\n{text}", task="sentiment")
+
+    async def analyze_document(self, text, user_additions=None, structured=STRUCTURED_ANALYSIS):
+        """
+        asyncio counterpart of OllamaIntegration.analyze_document.
+
+        Returns:
+            dict: summary, sentiment, notes, chunks, structured and seconds.
+        """
+        started = time.perf_counter()
+        notes_prompt, notes_summaries_prompt, analysis_prompt = NOTES_PROMPT, NOTES_FROM_SUMMARIES_PROMPT, ANALYSIS_PROMPT
+        if user_additions:
+            notes_prompt = f"{notes_prompt}\n\nUser Additions: {user_additions}"
+            notes_summaries_prompt = f"{notes_summaries_prompt}\n\nUser Additions: {user_additions}"
+            analysis_prompt = f"{analysis_prompt}\n\nUser Additions: {user_additions}"
+        chunks = chunk_text(text, self.summary_chunk_tokens)
+        analysis = None
+        if structured and len(chunks) == 1:
+            reply = await self.send_prompt(f"{analysis_prompt}\n{chunks[0]}", task="analysis", format=ANALYSIS_SCHEMA)
+            analysis = parse_analysis(reply)
+            if analysis is None:
+                log_event("Structured analysis reply was not valid JSON; running separate prompts (async)",
+                          logging.WARNING)
+        used_structured = analysis is not None
+
+        if analysis is None and len(chunks) == 1:
+            results = await asyncio.gather(
+                self.send_prompt(f"{SUMMARY_PROMPT}\n{chunks[0]}", task="summary_final"),
+                self.send_prompt(f"{SENTIMENT_PROMPT}\n{chunks[0]}", task="sentiment"),
+                self.send_prompt(f"{notes_prompt}\n{chunks[0]}", task="notes"),
+            )
+            analysis = dict(zip(ANALYSIS_FIELDS, results))
+        elif analysis is None and chunks:
+            # One map phase; the three results are written from its summaries.
+            summaries = await self._reduce_summaries(chunks)
+            joined = "\n\n".join(summaries)
+            results = await asyncio.gather(
+                self.send_prompt(f"{COMBINE_PROMPT}\n{joined}", task="summary_final") if len(summaries) > 1
+                else asyncio.sleep(0, summaries[0]),
+                self.send_prompt(f"{SENTIMENT_FROM_SUMMARIES_PROMPT}\n{joined}", task="sentiment"),
+                self.send_prompt(f"{notes_summaries_prompt}\n{joined}", task="notes"),
+            )
+            analysis = dict(zip(ANALYSIS_FIELDS, results))
+        elif analysis is None:
+            analysis = {field: "" for field in ANALYSIS_FIELDS}
+        analysis.update(chunks=len(chunks), structured=used_structured, seconds=time.perf_counter() - started)
+        return analysis
+
+
 # This can be run as a standalone test.
 if __name__ == "__main__":
     print("Starting main execution...")
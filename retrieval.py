@@ -0,0 +1,287 @@
+# Developer: Eric Neftali Paiz
+import json
+import logging
+import os
+import threading
+import numpy as np
+from artifact_store import load_object_info
+from file_lock import FileLock
+from http_transport import post
+from instrumentation import log_event, metrics, span
+from model_manager import get_model_manager
+from storage_janitor import data_dir, ensure_data_dirs
+from text_chunking import chunk_text
+
+# Chunks of every indexed document are embedded with a local Ollama embedding model
+# and kept as L2-normalised float32 rows in one flat file, read back as a NumPy
+# memmap. metadata.jsonl holds one line per row (document, page, chunk text).
+# index.json records how many rows and metadata bytes are committed, so whatever
+# an interrupted update wrote past that is ignored and overwritten by the next one.
+# Updates and searches hold index.lock, so the app and batch_cli can share the
+# index, and vectors are only mapped for the duration of a search (Windows will
+# not truncate or extend a file while a mapping of it is open).
+INDEX_DIR = data_dir("data/index")
+EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+# Small chunks keep retrieved context focused; they are split within pages so a
+# hit can cite its page.
+RETRIEVAL_CHUNK_TOKENS = int(os.getenv("RETRIEVAL_CHUNK_TOKENS", "300"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+# Rows scored per matrix product, to bound memory on large indexes.
+SEARCH_BLOCK_ROWS = 65536
+
+VECTORS_FILE = "vectors.f32"
+METADATA_FILE = "metadata.jsonl"
+STATE_FILE = "index.json"
+LOCK_FILE = "index.lock"
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def chunk_pages(pages, max_tokens=RETRIEVAL_CHUNK_TOKENS):
+    """
+    Splits page texts into retrieval chunks.
+
+    Returns:
+        list: (page_number, chunk_text) pairs, pages numbered from 1.
+    """
+    return [
+        (number, chunk)
+        for number, page_text in enumerate(pages, start=1)
+        for chunk in chunk_text(page_text, max_tokens)
+    ]
+
+
+class RetrievalIndex:
+    """
+    Embedding index over the chunks of stored documents, searched by brute-force
+    cosine similarity. Documents are added once, keyed by store digest, so indexing
+    is incremental: only new uploads are embedded.
+    """
+
+    def __init__(self, base_url, path=INDEX_DIR, model=EMBED_MODEL):
+        self.base_url = base_url
+        self.path = path
+        self.model = model
+        self._lock = threading.Lock()
+        self._metadata = None
+        self._state_mtime = None
+        self.state = self._load_state()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load_state(self):
+        try:
+            self._state_mtime = os.path.getmtime(self._file(STATE_FILE))
+            with open(self._file(STATE_FILE), "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            state = None
+        if not state or state.get("model") != self.model:
+            # No index yet, or one built with another model whose vectors are not comparable.
+            if state:
+                log_event("Embedding model changed; rebuilding the retrieval index",
+                          logging.WARNING, previous=state.get("model"), model=self.model)
+            state = {"model": self.model, "dim": None, "rows": 0, "metadata_bytes": 0, "documents": {}}
+        return state
+
+    def _save_state(self):
+        path = self._file(STATE_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=4)
+        os.replace(tmp_path, path)
+        self._state_mtime = os.path.getmtime(path)
+
+    def _refresh(self):
+        """Picks up documents another process (e.g. batch_cli) added since the last look."""
+        try:
+            mtime = os.path.getmtime(self._file(STATE_FILE))
+        except FileNotFoundError:
+            return
+        if mtime != self._state_mtime:
+            self.state = self._load_state()
+            self._metadata = None
+
+    ### Embeddings ###
+    def embed(self, texts):
+        """
+        Embeds texts through Ollama's /api/embed endpoint.
+
+        Returns:
+            numpy.ndarray: One L2-normalised float32 row per text.
+        """
+        rows = []
+        keep_alive = get_model_manager(self.base_url).keep_alive
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            batch = texts[start:start + EMBED_BATCH_SIZE]
+            with span("retrieval.embed", model=self.model, inputs=len(batch)):
+                response = post(f"{self.base_url}/api/embed",
+                                json={"model": self.model, "input": batch, "keep_alive": keep_alive})
+                if response.status_code != 200:
+                    raise RuntimeError(f"Failed to embed text: {response.text}")
+                rows.extend(response.json()["embeddings"])
+        vectors = np.asarray(rows, dtype=np.float32).reshape(len(texts), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    ### Updates ###
+    def has_document(self, digest):
+        with self._lock:
+            self._refresh()
+            return digest in self.state["documents"]
+
+    def add_document(self, digest, pages, name=None):
+        """
+        Embeds and appends a document's chunks, unless it is already indexed.
+
+        Args:
+            digest (str): Store digest of the document.
+            pages (list): Page texts, in order.
+            name (str): Optional display name, e.g. the uploaded file name.
+
+        Returns:
+            int: Rows added (0 if the document was already indexed).
+        """
+        if self.has_document(digest):
+            return 0
+        chunks = chunk_pages(pages)
+        with span("retrieval.index", digest=digest, chunks=len(chunks)):
+            vectors = self.embed([chunk for _, chunk in chunks]) if chunks else None
+            ensure_data_dirs()
+            with self._lock, FileLock(self._file(LOCK_FILE)):
+                self._refresh()
+                if digest in self.state["documents"]:
+                    return 0
+                rows = self.state["rows"]
+                if vectors is not None:
+                    if self.state["dim"] is None:
+                        self.state["dim"] = int(vectors.shape[1])
+                    elif vectors.shape[1] != self.state["dim"]:
+                        raise RuntimeError(
+                            f"Embedding size changed from {self.state['dim']} to {vectors.shape[1]}; "
+                            f"delete {self.path} to rebuild the index."
+                        )
+                    self._append(rows, vectors, [
+                        {"digest": digest, "name": name, "page": page, "chunk": index, "text": chunk}
+                        for index, (page, chunk) in enumerate(chunks)
+                    ])
+                added = len(chunks)
+                self.state["rows"] = rows + added
+                self.state["documents"][digest] = {"name": name, "rows": [rows, rows + added]}
+                self._save_state()
+                self._metadata = None
+        metrics.inc("thoughtscribe_retrieval_rows_total", added)
+        return added
+
+    def _append(self, rows, vectors, metadata):
+        # Cut off anything an interrupted update wrote past the committed rows.
+        with open(self._file(VECTORS_FILE), "ab") as f:
+            f.truncate(rows * self.state["dim"] * 4)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self._file(METADATA_FILE), "ab") as f:
+            f.truncate(self.state["metadata_bytes"])
+            f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in metadata).encode("utf-8"))
+            self.state["metadata_bytes"] = f.tell()
+
+    def _read_metadata(self):
+        try:
+            with open(self._file(METADATA_FILE), "rb") as f:
+                data = f.read(self.state["metadata_bytes"])
+        except FileNotFoundError:
+            return []
+        return [json.loads(line) for line in data.decode("utf-8").splitlines() if line]
+
+    def _load_metadata(self):
+        """Returns the committed rows' metadata, read once per update."""
+        if self._metadata is None:
+            self._metadata = self._read_metadata()[:self.state["rows"]]
+        return self._metadata
+
+    def _score(self, query_vector, top_k, digests):
+        """
+        Scores the committed rows against a query vector. The vectors are mapped
+        here and unmapped when this returns; callers hold both locks.
+
+        Returns:
+            list: (row, score) pairs, best first.
+        """
+        rows, dim = self.state["rows"], self.state["dim"]
+        vectors = np.memmap(self._file(VECTORS_FILE), dtype=np.float32, mode="r", shape=(rows, dim))
+        allowed = None
+        if digests is not None:
+            allowed = np.zeros(rows, dtype=bool)
+            for digest in digests:
+                if digest in self.state["documents"]:
+                    start, stop = self.state["documents"][digest]["rows"]
+                    allowed[start:stop] = True
+        scores = np.empty(rows, dtype=np.float32)
+        for start in range(0, rows, SEARCH_BLOCK_ROWS):
+            scores[start:start + SEARCH_BLOCK_ROWS] = vectors[start:start + SEARCH_BLOCK_ROWS] @ query_vector
+        if allowed is not None:
+            scores[~allowed] = -np.inf
+        top_k = min(top_k, int(np.isfinite(scores).sum()))
+        if top_k <= 0:
+            return []
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(row), float(scores[row])) for row in best]
+
+    ### Search ###
+    def search(self, query, top_k=RETRIEVAL_TOP_K, digests=None):
+        """
+        Finds the chunks most similar to a query.
+
+        Args:
+            query (str): The question or search text.
+            top_k (int): Number of chunks to return.
+            digests: Optional documents to search within; all documents by default.
+
+        Returns:
+            list: Hits, best first, each a metadata dict plus "score" (cosine similarity).
+        """
+        with self._lock:
+            self._refresh()
+            rows = self.state["rows"]
+        if not rows:
+            return []
+        with span("retrieval.search", rows=rows, top_k=top_k) as current:
+            query_vector = self.embed([query])[0]
+            with self._lock, FileLock(self._file(LOCK_FILE)):
+                self._refresh()
+                if not self.state["rows"]:
+                    return []
+                best = self._score(query_vector, top_k, digests)
+                metadata = self._load_metadata()
+            if best:
+                current.set_tag(best_score=round(best[0][1], 4))
+        return [{**metadata[row], "score": score} for row, score in best]
+
+
+def get_retrieval_index(base_url):
+    """Returns the process-wide RetrievalIndex for an Ollama host."""
+    with _indexes_lock:
+        index = _indexes.get(base_url)
+        if index is None:
+            index = RetrievalIndex(base_url)
+            _indexes[base_url] = index
+        return index
+
+
+def index_stored_document(digest, base_url, workers=1):
+    """
+    Adds a stored, extracted upload to the retrieval index, page by page.
+
+    Returns:
+        int: Rows added (0 if it was already indexed).
+    """
+    from text_extraction import load_page_index, load_pages
+
+    index = get_retrieval_index(base_url)
+    if index.has_document(digest):
+        return 0
+    page_index = load_page_index(digest, workers=workers)
+    names = (load_object_info(digest) or {}).get("names") or [None]
+    return index.add_document(digest, load_pages(digest, 0, page_index["pages"], page_index), name=names[0])
@@ -0,0 +1,284 @@
+# Developer: Eric Neftali Paiz
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from instrumentation import log_event, metrics
+
+# Byte quotas for the data/ directories, enforced by a background thread. Sizes are
+# tracked in a ledger that is built with one scandir pass at start-up and then kept
+# current from write/access notifications, so the tree is never rescanned.
+MB = 1024 * 1024
+JANITOR_INTERVAL = float(os.getenv("JANITOR_INTERVAL", "30"))
+# Entries touched more recently than this are never evicted, so files that are
+# still being written or served are left alone.
+JANITOR_MIN_IDLE = float(os.getenv("JANITOR_MIN_IDLE", "300"))
+
+# (directory, byte quota, entry depth). Depth 0 makes every file its own entry;
+# depth 2 treats data/store/<ab>/<digest>/ as one entry so an upload and its
+# derived artifacts are evicted together.
+DEFAULT_QUOTAS = [
+    ("data/audio", int(os.getenv("AUDIO_QUOTA_MB", "1024")) * MB, 0),
+    ("data/uploaded", int(os.getenv("UPLOADED_QUOTA_MB", "1024")) * MB, 0),
+    ("data/store", int(os.getenv("STORE_QUOTA_MB", "4096")) * MB, 2),
+    ("data/temp", int(os.getenv("TEMP_QUOTA_MB", "512")) * MB, 0),
+    ("data/spool", int(os.getenv("SPOOL_QUOTA_MB", "512")) * MB, 0),
+    ("data/jobs", int(os.getenv("JOBS_QUOTA_MB", "64")) * MB, 0),
+    ("data/summary_cache", int(os.getenv("SUMMARY_CACHE_QUOTA_MB", "64")) * MB, 0),
+    # Long audio published for download by main.show_audio; hard links into data/store.
+    ("static/audio", int(os.getenv("STATIC_AUDIO_QUOTA_MB", "1024")) * MB, 0),
+]
+
+_janitor = None
+_janitor_lock = threading.Lock()
+
+# Modules declare the data/ directories they write to with data_dir() at import
+# time, which does no I/O; ensure_data_dirs() creates them once per process.
+_data_dirs = []
+_data_dirs_ready = False
+_data_dirs_lock = threading.Lock()
+
+
+def data_dir(path):
+    """Registers a directory for ensure_data_dirs and returns the path unchanged."""
+    global _data_dirs_ready
+    with _data_dirs_lock:
+        if path not in _data_dirs:
+            _data_dirs.append(path)
+            _data_dirs_ready = False
+    return path
+
+
+def ensure_data_dirs():
+    """
+    Creates every registered data directory. Only the first call after a new
+    directory is registered touches the filesystem, so it is cheap to call before
+    any write.
+    """
+    global _data_dirs_ready
+    if _data_dirs_ready:
+        return
+    with _data_dirs_lock:
+        for path in _data_dirs:
+            os.makedirs(path, exist_ok=True)
+        _data_dirs_ready = True
+
+
+class _QuotaDirectory:
+    def __init__(self, path, max_bytes, entry_depth):
+        self.path = os.path.normpath(path)
+        self.max_bytes = max_bytes
+        self.entry_depth = entry_depth
+        self.entries = {}
+        self.total_bytes = 0
+
+    def entry_for(self, path):
+        relative = os.path.relpath(os.path.normpath(path), self.path)
+        if relative.startswith(os.pardir) or relative == os.curdir:
+            return None
+        if self.entry_depth:
+            parts = relative.split(os.sep)
+            if len(parts) <= self.entry_depth:
+                return None
+            relative = os.path.join(*parts[:self.entry_depth])
+        return os.path.join(self.path, relative)
+
+    def set_size(self, entry, size, accessed):
+        old_size, _ = self.entries.get(entry, (0, 0))
+        self.entries[entry] = (size, accessed)
+        self.total_bytes += size - old_size
+
+    def remove(self, entry):
+        size, _ = self.entries.pop(entry, (0, 0))
+        self.total_bytes -= size
+        return size
+
+
+def _scan_sizes(path):
+    """Yields (file path, size, last access) for every file under path, using scandir."""
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from _scan_sizes(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    yield entry.path, stat.st_size, max(stat.st_atime, stat.st_mtime)
+    except FileNotFoundError:
+        return
+
+
+class StorageJanitor:
+    """
+    Enforces per-directory byte quotas with least-recently-used eviction.
+
+    Request code only enqueues notifications (notify_write / notify_access); the
+    janitor thread applies them to the ledger and evicts off the request path.
+    """
+
+    def __init__(self, quotas=None, interval=JANITOR_INTERVAL, min_idle=JANITOR_MIN_IDLE):
+        self.directories = [_QuotaDirectory(path, max_bytes, depth) for path, max_bytes, depth in (quotas or DEFAULT_QUOTAS)]
+        self.interval = interval
+        self.min_idle = min_idle
+        self.events = queue.Queue()
+        self.stats = {"reclaimed_bytes": 0, "evicted_entries": 0, "runs": 0, "last_run": None}
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _directory_for(self, path):
+        for directory in self.directories:
+            entry = directory.entry_for(path)
+            if entry is not None:
+                return directory, entry
+        return None, None
+
+    def _entry_size(self, directory, entry):
+        if directory.entry_depth:
+            return sum(size for _, size, _ in _scan_sizes(entry)) if os.path.isdir(entry) else None
+        try:
+            return os.stat(entry).st_size
+        except FileNotFoundError:
+            return None
+
+    def build_ledger(self):
+        with self._lock:
+            for directory in self.directories:
+                directory.entries.clear()
+                directory.total_bytes = 0
+                for path, size, accessed in _scan_sizes(directory.path):
+                    entry = directory.entry_for(path)
+                    if entry is None:
+                        continue
+                    old_size, old_accessed = directory.entries.get(entry, (0, 0))
+                    directory.set_size(entry, old_size + size, max(old_accessed, accessed))
+
+    def _apply_event(self, kind, path, when):
+        directory, entry = self._directory_for(path)
+        if directory is None:
+            return
+        if kind == "access":
+            if entry in directory.entries:
+                size, _ = directory.entries[entry]
+                directory.entries[entry] = (size, when)
+            return
+        size = self._entry_size(directory, entry)
+        if size is None:
+            directory.remove(entry)
+        else:
+            directory.set_size(entry, size, when)
+
+    def _drain_events(self):
+        while True:
+            try:
+                kind, path, when = self.events.get_nowait()
+            except queue.Empty:
+                return
+            self._apply_event(kind, path, when)
+
+    def _evict(self, directory, entry):
+        try:
+            if os.path.isdir(entry):
+                shutil.rmtree(entry)
+                if os.path.normpath(directory.path) == os.path.normpath("data/store"):
+                    from artifact_store import forget_object
+                    forget_object(os.path.basename(entry))
+            else:
+                os.remove(entry)
+        except FileNotFoundError:
+            pass
+        reclaimed = directory.remove(entry)
+        self.stats["reclaimed_bytes"] += reclaimed
+        self.stats["evicted_entries"] += 1
+        metrics.inc("thoughtscribe_storage_reclaimed_bytes_total", reclaimed, directory=directory.path)
+        metrics.inc("thoughtscribe_storage_evictions_total", directory=directory.path)
+        log_event("Evicted storage entry", path=entry, reclaimed_bytes=reclaimed)
+
+    def enforce_quotas(self):
+        """
+        Applies pending notifications and evicts least recently used entries in
+        every directory that is over its quota.
+        """
+        with self._lock:
+            self._drain_events()
+            now = time.time()
+            for directory in self.directories:
+                if directory.total_bytes <= directory.max_bytes:
+                    continue
+                by_age = sorted(directory.entries.items(), key=lambda item: item[1][1])
+                for entry, (_, accessed) in by_age:
+                    if directory.total_bytes <= directory.max_bytes:
+                        break
+                    if now - accessed < self.min_idle:
+                        break
+                    self._evict(directory, entry)
+            self.stats["runs"] += 1
+            self.stats["last_run"] = now
+            for directory in self.directories:
+                metrics.set("thoughtscribe_storage_used_bytes", directory.total_bytes, directory=directory.path)
+                metrics.set("thoughtscribe_storage_quota_bytes", directory.max_bytes, directory=directory.path)
+                metrics.set("thoughtscribe_storage_entries", len(directory.entries), directory=directory.path)
+            metrics.set("thoughtscribe_storage_last_run_timestamp_seconds", now)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["directories"] = {
+                directory.path: {
+                    "used_bytes": directory.total_bytes,
+                    "quota_bytes": directory.max_bytes,
+                    "entries": len(directory.entries),
+                }
+                for directory in self.directories
+            }
+            return stats
+
+    def _run(self):
+        self.build_ledger()
+        while not self._stop.is_set():
+            try:
+                self.enforce_quotas()
+            except Exception as e:
+                log_event("Storage janitor run failed", logging.ERROR, error=str(e))
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="storage-janitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def start_janitor(quotas=None):
+    """
+    Starts the process-wide janitor once; later calls return the running instance.
+    """
+    global _janitor
+    with _janitor_lock:
+        if _janitor is None:
+            _janitor = StorageJanitor(quotas).start()
+        return _janitor
+
+
+def get_janitor():
+    return _janitor
+
+
+def notify_write(path):
+    """Tells the janitor a file was created, replaced or grew. No-op if it isn't running."""
+    if _janitor is not None:
+        _janitor.events.put(("write", path, time.time()))
+
+
+def notify_access(path):
+    """Tells the janitor a file was read, for LRU ordering. No-op if it isn't running."""
+    if _janitor is not None:
+        _janitor.events.put(("access", path, time.time()))
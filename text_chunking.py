@@ -0,0 +1,84 @@
+# Developer: Eric Neftali Paiz
+import re
+
+# Rough characters-per-token ratio for English prose with llama-style tokenizers.
+# Good enough for budgeting prompts without shipping a tokenizer.
+CHARS_PER_TOKEN = 4
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _split_oversized(piece, max_chars):
+    """Splits a paragraph that is over budget at sentence ends, then hard-wraps."""
+    parts = []
+    for sentence in _SENTENCE_END.split(piece):
+        while len(sentence) > max_chars:
+            parts.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if sentence:
+            parts.append(sentence)
+    return parts
+
+
+def split_pieces(text, max_chars):
+    """
+    Splits text into the units split_text packs: paragraphs, and the sentences (or
+    hard-wrapped parts) of paragraphs over max_chars.
+    """
+    max_chars = max(1, max_chars)
+    pieces = []
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) > max_chars:
+            pieces.extend(_split_oversized(paragraph, max_chars))
+        else:
+            pieces.append(paragraph)
+    return pieces
+
+
+def chunk_text(text, max_tokens):
+    """
+    Splits text into chunks that each fit a token budget.
+
+    Chunks break at paragraph boundaries where possible, then at sentence ends,
+    and only cut mid-sentence when a single sentence is over budget.
+
+    Args:
+        text (str): The text to split.
+        max_tokens (int): Token budget per chunk.
+
+    Returns:
+        list: Chunks of text, in document order.
+    """
+    return split_text(text, max_tokens * CHARS_PER_TOKEN)
+
+
+def split_text(text, max_chars):
+    """
+    Same as chunk_text, with the budget given in characters.
+    """
+    max_chars = max(1, max_chars)
+    pieces = split_pieces(text, max_chars)
+
+    chunks = []
+    current = []
+    current_len = 0
+    for piece in pieces:
+        added = len(piece) + (2 if current else 0)
+        if current and current_len + added > max_chars:
+            chunks.append("\n\n".join(current))
+            current = []
+            current_len = 0
+            added = len(piece)
+        current.append(piece)
+        current_len += added
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
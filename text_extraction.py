@@ -1,31 +1,215 @@
 # Developer: Eric Neftali Paiz
+import hashlib
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor
 import fitz
+from instrumentation import span
+from storage_janitor import data_dir, ensure_data_dirs
+from artifact_store import (
+    PAGE_INDEX_ARTIFACT, SOURCE_ARTIFACT, TEXT_ARTIFACT,
+    artifact_path, has_artifact, load_artifact, read_artifact_range, save_artifact, store_uploaded_file,
+)
 
-UPLOAD_DIR = "data/uploaded"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+UPLOAD_DIR = data_dir("data/uploaded")
+
+# Pages handed to a worker process per task in parallel mode. Small enough that
+# the first pages come back quickly, large enough to amortize opening the PDF.
+PAGES_PER_TASK = 16
 
 def save_uploaded_file(uploaded_file):
-    file_path = os.path.join(UPLOAD_DIR, uploaded_file.name)
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.read())
-    return file_path
+    digest = store_uploaded_file(uploaded_file)
+    return artifact_path(digest, SOURCE_ARTIFACT)
 
-def extract_text_from_pdf(filename: str):
+def count_pdf_pages(filename: str):
     try:
-        doc = fitz.open(filename=filename)
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        return text
+        with fitz.open(filename=filename) as doc:
+            return doc.page_count
+    except Exception as e:
+        raise ValueError(f"Failed to open PDF: {e}")
+
+def _extract_page_range(filename, start, stop):
+    """
+    Extracts the text of pages [start, stop) in a worker process.
+
+    Returns:
+        list: Page texts in page order.
+    """
+    with fitz.open(filename=filename) as doc:
+        return [doc[number].get_text() for number in range(start, min(stop, doc.page_count))]
+
+def iter_pdf_pages(filename: str, workers=1):
+    """
+    Yields the text of each page of a PDF, in order, as it is extracted.
+
+    Args:
+        filename: Path to the PDF file.
+        workers: Number of processes to spread page ranges across. With 1, or
+            when the PDF fits in a single task, the pages are read in this process;
+            starting a pool costs more than it saves on short documents.
+
+    Yields:
+        str: The text of the next page.
+    """
+    try:
+        page_count = count_pdf_pages(filename) if workers and workers > 1 else 0
+        if page_count <= PAGES_PER_TASK:
+            workers = 1
+        with span("pdf.extract", workers=workers) as current:
+            pages = 0
+            if workers > 1:
+                ranges = [(start, start + PAGES_PER_TASK) for start in range(0, page_count, PAGES_PER_TASK)]
+                with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+                    futures = [pool.submit(_extract_page_range, filename, start, stop) for start, stop in ranges]
+                    # Futures are consumed in submission order so pages come out in order,
+                    # while later ranges keep extracting in the background.
+                    for future in futures:
+                        for page_text in future.result():
+                            pages += 1
+                            yield page_text
+            else:
+                with fitz.open(filename=filename) as doc:
+                    for page in doc:
+                        pages += 1
+                        yield page.get_text()
+            current.set_tag(pages=pages)
+    except ValueError:
+        raise
     except Exception as e:
         raise ValueError(f"Failed to extract text from PDF: {e}")
-    
+
+def extract_text_from_pdf(filename: str, workers=1):
+    return "".join(iter_pdf_pages(filename, workers=workers))
+
+def hash_page(page_text):
+    return hashlib.sha256(page_text.encode("utf-8")).hexdigest()
+
+def build_page_index(pages):
+    """
+    Records where each page starts in the UTF-8 encoding of "".join(pages), and a
+    content hash per page so a revised upload can be compared page by page.
+
+    Returns:
+        dict: "pages" (count), "offsets" (page_count + 1 byte offsets; page n is
+            bytes offsets[n] to offsets[n + 1]) and "hashes" (SHA-256 per page).
+    """
+    offsets = [0]
+    for page_text in pages:
+        offsets.append(offsets[-1] + len(page_text.encode("utf-8")))
+    return {"pages": len(pages), "offsets": offsets, "hashes": [hash_page(page_text) for page_text in pages]}
+
+def extract_to_store(digest, workers=1, on_page=None):
+    """
+    Extracts a stored upload and saves its text together with the page index.
+
+    Args:
+        digest: Digest of the upload in the artifact store.
+        workers: Number of extraction processes, see iter_pdf_pages.
+        on_page: Optional callable(extracted, page_count, page_text) called as
+            each page arrives, e.g. to show progress.
+
+    Returns:
+        str: The extracted text.
+    """
+    source_path = artifact_path(digest, SOURCE_ARTIFACT)
+    page_count = count_pdf_pages(source_path)
+    pages = []
+    for page_text in iter_pdf_pages(source_path, workers=workers):
+        pages.append(page_text)
+        if on_page:
+            on_page(len(pages), page_count, page_text)
+    text = "".join(pages)
+    save_artifact(digest, TEXT_ARTIFACT, text)
+    save_artifact(digest, PAGE_INDEX_ARTIFACT, json.dumps(build_page_index(pages)))
+    return text
+
+def extract_stored_text(digest, workers=1):
+    """
+    Returns the text of a stored upload, extracting it only the first time.
+
+    Args:
+        digest: Digest of the upload in the artifact store.
+        workers: Number of extraction processes, see iter_pdf_pages.
+
+    Returns:
+        str: The extracted text.
+    """
+    text = load_artifact(digest, TEXT_ARTIFACT)
+    if text is None:
+        text = extract_to_store(digest, workers=workers)
+    return text
+
+def load_page_index(digest, workers=1):
+    """
+    Returns the page index of a stored upload. Uploads extracted before page
+    indexes existed are extracted once more to build it.
+    """
+    index = load_artifact(digest, PAGE_INDEX_ARTIFACT)
+    if index is None:
+        extract_to_store(digest, workers=workers)
+        index = load_artifact(digest, PAGE_INDEX_ARTIFACT)
+    return json.loads(index)
+
+def load_pages(digest, start, stop, index=None):
+    """
+    Reads the text of pages [start, stop) of a stored upload, touching only
+    those bytes of the extracted text.
+
+    Args:
+        digest: Digest of the upload in the artifact store.
+        start: First page, 0-based.
+        stop: Page after the last one; clamped to the page count.
+        index: The page index, if the caller already has it.
+
+    Returns:
+        list: Page texts in page order.
+
+    Raises:
+        ValueError: If the upload is no longer in the store.
+    """
+    index = index or load_page_index(digest)
+    offsets = index["offsets"]
+    start, stop = max(0, start), min(stop, index["pages"])
+    if start >= stop:
+        return []
+    data = read_artifact_range(digest, TEXT_ARTIFACT, offsets[start], offsets[stop])
+    if data is None:
+        # The extracted text is gone (e.g. the janitor evicted the upload); extract
+        # it again if the source is still there.
+        if not has_artifact(digest, SOURCE_ARTIFACT):
+            raise ValueError("The document is no longer stored; please upload it again.")
+        extract_to_store(digest)
+        index = json.loads(load_artifact(digest, PAGE_INDEX_ARTIFACT))
+        offsets = index["offsets"]
+        data = read_artifact_range(digest, TEXT_ARTIFACT, offsets[start], offsets[stop])
+    base = offsets[start]
+    return [
+        data[offsets[number] - base:offsets[number + 1] - base].decode("utf-8")
+        for number in range(start, stop)
+    ]
+
+def load_page_hashes(digest, start, stop, index=None):
+    """
+    Returns the content hashes of pages [start, stop). Indexes written before
+    hashes were recorded get them computed from the stored text.
+    """
+    index = index or load_page_index(digest)
+    if "hashes" in index:
+        return index["hashes"][max(0, start):min(stop, index["pages"])]
+    return [hash_page(page_text) for page_text in load_pages(digest, start, stop, index)]
+
+def load_page_range_text(digest, pages, index=None):
+    """Returns the text of a (start, stop) page range, or the whole text when pages is None."""
+    if pages is None:
+        return load_artifact(digest, TEXT_ARTIFACT)
+    return "".join(load_pages(digest, pages[0], pages[1], index))
+
 def prompt_save_text(text: str):
     save_name = input("Enter the filename to save the extracted text (e.g., output.txt): ").strip()
     if not save_name.endswith(".txt"):
         save_name += ".txt"
     save_path = os.path.join(UPLOAD_DIR, save_name)
+    ensure_data_dirs()
 
     try:
         with open(save_path, "w", encoding="utf-8") as f:
@@ -34,4 +218,3 @@ def prompt_save_text(text: str):
     except Exception as e:
         print(f"Failed to save text file: {e}")
 
-    
\ No newline at end of file
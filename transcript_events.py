@@ -0,0 +1,176 @@
+# Developer: Eric Neftali Paiz
+import logging
+import os
+import threading
+import time
+from collections import deque
+from instrumentation import bind, log_event, metrics, span
+from util import append_chat_messages, close_chat_history
+
+# Live conversation transcripts. The Conversation worker threads only append to a
+# bounded ring buffer in memory; the Streamlit script thread renders new turns in
+# batches and a background thread appends them to the session's chat history, so
+# neither the UI nor the disk is ever touched from the audio threads and memory
+# stays constant however long the session runs.
+TRANSCRIPT_BUFFER_SIZE = int(os.getenv("TRANSCRIPT_BUFFER_SIZE", "500"))
+# Seconds between batched appends to the chat history.
+TRANSCRIPT_PERSIST_INTERVAL = float(os.getenv("TRANSCRIPT_PERSIST_INTERVAL", "1.0"))
+# Seconds between transcript refreshes in the UI.
+TRANSCRIPT_FLUSH_INTERVAL = float(os.getenv("TRANSCRIPT_FLUSH_INTERVAL", "0.5"))
+
+
+class TranscriptBus:
+    """
+    Bounded event bus for one conversation's transcript.
+
+    Events are (seq, sender, message) tuples with increasing sequence numbers.
+    Readers keep the last sequence number they saw and ask for what came after
+    it with since(); if a reader falls more than `capacity` events behind, the
+    oldest events it missed are gone and reported as dropped.
+
+    Args:
+        session_id (str): Chat history session the turns are persisted to, or None
+            to keep them in memory only.
+        capacity (int): Events kept in the ring buffer.
+        persist_interval (float): Seconds between batched chat history appends.
+    """
+
+    def __init__(self, session_id=None, capacity=TRANSCRIPT_BUFFER_SIZE, persist_interval=TRANSCRIPT_PERSIST_INTERVAL):
+        self.session_id = session_id
+        self.capacity = capacity
+        self.persist_interval = persist_interval
+        self._events = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._pending = threading.Event()
+        self._closed = threading.Event()
+        self._persisted_seq = 0
+        self.stats = {"published": 0, "persisted": 0, "dropped": 0}
+        self._thread = None
+
+    ### Producers ###
+    def publish(self, sender, message):
+        """
+        Adds a turn. Safe to call from any thread; never waits on I/O.
+
+        Returns:
+            int: The event's sequence number.
+        """
+        with self._lock:
+            self._seq += 1
+            self._events.append((self._seq, sender, message))
+            self.stats["published"] += 1
+            seq = self._seq
+        self._pending.set()
+        return seq
+
+    def callback(self, sender):
+        """Returns a callable(text) that publishes text as sender, for Conversation callbacks."""
+        return lambda text: self.publish(sender, text)
+
+    ### Consumers ###
+    def since(self, seq):
+        """
+        Returns the events after sequence number seq.
+
+        Returns:
+            tuple: (events, last_seq, dropped) where events is a list of
+                (seq, sender, message), last_seq is the sequence number to pass next
+                time and dropped is how many events after seq were already overwritten.
+        """
+        with self._lock:
+            events = [event for event in self._events if event[0] > seq]
+            last_seq = self._seq
+        first_seq = events[0][0] if events else last_seq + 1
+        return events, last_seq, max(0, first_seq - seq - 1)
+
+    def recent(self, limit=None):
+        """Returns the newest events still in the buffer, oldest first."""
+        with self._lock:
+            events = list(self._events)
+        return events[-limit:] if limit else events
+
+    @property
+    def last_seq(self):
+        with self._lock:
+            return self._seq
+
+    @property
+    def closed(self):
+        return self._closed.is_set()
+
+    ### Persistence ###
+    def _persist_pending(self):
+        events, last_seq, dropped = self.since(self._persisted_seq)
+        if events:
+            with span("transcript.persist", events=len(events)):
+                append_chat_messages(self.session_id, [(sender, message) for _, sender, message in events])
+            self.stats["persisted"] += len(events)
+        if dropped:
+            # Only possible if persistence falls a whole buffer behind.
+            self.stats["dropped"] += dropped
+            log_event("Transcript events dropped before they were saved", logging.WARNING,
+                      session_id=self.session_id, dropped=dropped)
+            metrics.inc("thoughtscribe_transcript_dropped_total", dropped)
+        self._persisted_seq = last_seq
+
+    def _run(self):
+        while True:
+            closing = self._closed.wait(self.persist_interval)
+            if self._pending.is_set() or closing:
+                self._pending.clear()
+                try:
+                    self._persist_pending()
+                except Exception as e:
+                    # The events stay in the buffer and are retried on the next pass.
+                    log_event("Failed to save transcript", logging.ERROR, session_id=self.session_id, error=str(e))
+                    self._pending.set()
+            if closing:
+                return
+
+    def start(self):
+        """Starts the background persistence thread (no-op without a session_id)."""
+        if self.session_id and self._thread is None:
+            self._thread = threading.Thread(target=bind(self._run), name="transcript-persist", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self, timeout=5.0):
+        """
+        Stops accepting work, saves what is left and closes the chat history log.
+        """
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            close_chat_history(self.session_id)
+        log_event("Transcript closed", session_id=self.session_id, **self.stats)
+
+
+def render_transcript(events):
+    """Formats transcript events as Markdown, one turn per paragraph."""
+    return "\n\n".join(f"**{sender}:** {message}" for _, sender, message in events)
+
+
+def follow_transcript(bus, placeholder, limit=50, interval=TRANSCRIPT_FLUSH_INTERVAL, should_stop=None):
+    """
+    Refreshes a Streamlit placeholder with the newest turns, at most once per
+    interval and only when something new arrived, until the bus closes or
+    should_stop() returns True. Runs on the script thread; a rerun (e.g. a button
+    click) interrupts it.
+
+    Args:
+        bus (TranscriptBus): The conversation's transcript.
+        placeholder: An st.empty() slot.
+        limit (int): Turns shown.
+        interval (float): Seconds between refreshes.
+        should_stop: Optional callable checked between refreshes.
+    """
+    shown_seq = -1
+    while True:
+        last_seq = bus.last_seq
+        if last_seq != shown_seq:
+            placeholder.markdown(render_transcript(bus.recent(limit)))
+            shown_seq = last_seq
+        if bus.closed or (should_stop and should_stop()):
+            return
+        time.sleep(interval)
@@ -1,12 +1,19 @@
 import os
+import atexit
 import json
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from cryptography.fernet import Fernet
+from instrumentation import log_event, span
+from storage_janitor import data_dir, ensure_data_dirs, notify_write
+from text_chunking import estimate_tokens
 import os
 import json
 
 # Generate a key (do this once and save it securely)
 def generate_encryption_key():
+    from cryptography.fernet import Fernet
     key = Fernet.generate_key()
     with open("encryption.key", "wb") as key_file:
         key_file.write(key)
@@ -18,12 +25,14 @@ def load_encryption_key():
 
 # Encrypt sensitive data
 def encrypt_data(data):
+    from cryptography.fernet import Fernet
     key = load_encryption_key()
     cipher = Fernet(key)
     return cipher.encrypt(data.encode()).decode()
 
 # Decrypt sensitive data
 def decrypt_data(encrypted_data):
+    from cryptography.fernet import Fernet
     key = load_encryption_key()
     cipher = Fernet(key)
     return cipher.decrypt(encrypted_data.encode()).decode()
@@ -33,7 +42,8 @@ def save_user_settings(settings):
     # Encrypt the API key before saving
     if "api_key" in settings:
         settings["api_key"] = encrypt_data(settings["api_key"])
-    
+
+    ensure_data_dirs()
     with open(settings_path, "w") as f:
         json.dump(settings, f, indent=4)
 
@@ -52,27 +62,25 @@ def load_user_settings():
 
 # Base directories
 BASE_DIR = "data"
-CHAT_LOGS_DIR = os.path.join(BASE_DIR, "chat_logs")
-AUDIO_DIR = os.path.join(BASE_DIR, "audio")
-UPLOADED_DIR = os.path.join(BASE_DIR, "uploaded")
-TEMP_DIR = os.path.join(BASE_DIR, "temp")
-
-# Ensure directories exist
-os.makedirs(CHAT_LOGS_DIR, exist_ok=True)
-os.makedirs(AUDIO_DIR, exist_ok=True)
-os.makedirs(UPLOADED_DIR, exist_ok=True)
-os.makedirs(TEMP_DIR, exist_ok=True)
+# Created by ensure_data_dirs() at startup or before the first write, not at import.
+CHAT_LOGS_DIR = data_dir(os.path.join(BASE_DIR, "chat_logs"))
+AUDIO_DIR = data_dir(os.path.join(BASE_DIR, "audio"))
+UPLOADED_DIR = data_dir(os.path.join(BASE_DIR, "uploaded"))
+TEMP_DIR = data_dir(os.path.join(BASE_DIR, "temp"))
 
 ### File and Session Management ###
 def clean_old_files(directory, days=7):
-    now = datetime.now()
-    cutoff = now - timedelta(days=days)
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if datetime.fromtimestamp(os.path.getmtime(file_path)) < cutoff:
-                os.remove(file_path)
-                print(f"Deleted old file: {file_path}")
+    # Quota-based cleanup of the data/ directories runs in the background, see
+    # storage_janitor.start_janitor. This is the one-off, age-based variant.
+    cutoff = (datetime.now() - timedelta(days=days)).timestamp()
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                clean_old_files(entry.path, days)
+            elif entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                notify_write(entry.path)
+                log_event("Deleted old file", path=entry.path)
 
 
 def create_unique_filename(base_dir, filename):
@@ -86,23 +94,355 @@ def create_unique_filename(base_dir, filename):
 
 
 ### Chat History Management ###
+# Each session is an append-only JSONL log (one [sender, message] per line) plus a
+# small side index holding the message count, the byte offset of the latest
+# summary and how much of the log the index has seen. Appends never rewrite the
+# log and lookups never rescan it.
+HISTORY_FSYNC_EVERY = int(os.getenv("HISTORY_FSYNC_EVERY", "16"))
+HISTORY_FSYNC_INTERVAL = float(os.getenv("HISTORY_FSYNC_INTERVAL", "2.0"))
+# Session logs kept open for appending; the least recently used one is synced and
+# closed when another session needs a handle, so descriptors stay bounded.
+HISTORY_OPEN_LOGS = int(os.getenv("HISTORY_OPEN_LOGS", "32"))
+
+_history_lock = threading.RLock()
+_history_writers = OrderedDict()
+
+
+def _history_paths(session_id):
+    base = os.path.join(CHAT_LOGS_DIR, session_id)
+    return f"{base}.jsonl", f"{base}.index.json"
+
+
+def _is_summary(sender, message):
+    return sender == "Bot" and "Summary:" in message
+
+
+def _scan_history(log_path, index, start=0):
+    """Updates an index with the log entries from byte offset `start` on."""
+    with open(log_path, "rb") as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            if line.endswith(b"\n"):
+                sender, message = json.loads(line)
+                index["count"] += 1
+                if _is_summary(sender, message):
+                    index["latest_summary_offset"] = offset
+                offset += len(line)
+    index["size"] = offset
+    return index
+
+
+def _load_history_index(session_id):
+    log_path, index_path = _history_paths(session_id)
+    index = {"count": 0, "latest_summary_offset": None, "size": 0}
+    if os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    if not os.path.exists(log_path):
+        return {"count": 0, "latest_summary_offset": None, "size": 0}
+    size = os.path.getsize(log_path)
+    if index["size"] > size:
+        # Log was replaced behind our back; start over.
+        index = _scan_history(log_path, {"count": 0, "latest_summary_offset": None, "size": 0})
+    elif index["size"] < size:
+        # Entries made it to the log after the index was last written.
+        index = _scan_history(log_path, index, index["size"])
+    return index
+
+
+def _write_history_index(session_id, index):
+    _, index_path = _history_paths(session_id)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+
+def _migrate_legacy_history(session_id):
+    """Converts a pre-JSONL <session>.json history into the append-only format."""
+    legacy_path = os.path.join(CHAT_LOGS_DIR, f"{session_id}.json")
+    log_path, _ = _history_paths(session_id)
+    if os.path.exists(legacy_path) and not os.path.exists(log_path):
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            save_chat_history(session_id, json.load(f))
+        os.remove(legacy_path)
+
+
+def _get_history_writer(session_id):
+    writer = _history_writers.get(session_id)
+    if writer is not None:
+        _history_writers.move_to_end(session_id)
+    else:
+        while len(_history_writers) >= max(HISTORY_OPEN_LOGS, 1):
+            _close_chat_history(next(iter(_history_writers)))
+        ensure_data_dirs()
+        _migrate_legacy_history(session_id)
+        log_path, _ = _history_paths(session_id)
+        writer = {
+            "file": open(log_path, "ab"),
+            "index": _load_history_index(session_id),
+            "unsynced": 0,
+            "last_sync": time.monotonic(),
+        }
+        _history_writers[session_id] = writer
+    return writer
+
+
+def _sync_history_writer(session_id, writer):
+    writer["file"].flush()
+    os.fsync(writer["file"].fileno())
+    _write_history_index(session_id, writer["index"])
+    writer["unsynced"] = 0
+    writer["last_sync"] = time.monotonic()
+
+
+def append_chat_messages(session_id, messages):
+    """
+    Appends messages to a session's chat log in O(1), fsyncing in batches.
+
+    Args:
+        session_id (str): Unique ID for the session.
+        messages (list): (sender, message) pairs to append.
+    """
+    with span("history.append", session_id=session_id, messages=len(messages)), _history_lock:
+        writer = _get_history_writer(session_id)
+        index = writer["index"]
+        for sender, message in messages:
+            line = (json.dumps([sender, message], ensure_ascii=False) + "\n").encode("utf-8")
+            writer["file"].write(line)
+            if _is_summary(sender, message):
+                index["latest_summary_offset"] = index["size"]
+            index["count"] += 1
+            index["size"] += len(line)
+            writer["unsynced"] += 1
+        if (writer["unsynced"] >= HISTORY_FSYNC_EVERY
+                or time.monotonic() - writer["last_sync"] >= HISTORY_FSYNC_INTERVAL):
+            _sync_history_writer(session_id, writer)
+        else:
+            writer["file"].flush()
+
+
+def flush_chat_history(session_id=None):
+    """
+    Forces pending appends to disk for one session, or for every open session.
+    """
+    with _history_lock:
+        for sid, writer in list(_history_writers.items()):
+            if session_id is None or sid == session_id:
+                if writer["unsynced"]:
+                    _sync_history_writer(sid, writer)
+
+
+def _close_chat_history(session_id):
+    writer = _history_writers.pop(session_id, None)
+    if writer:
+        if writer["unsynced"]:
+            _sync_history_writer(session_id, writer)
+        writer["file"].close()
+
+
+def close_chat_history(session_id):
+    """Syncs and closes a session's open log once no more messages are coming."""
+    with _history_lock:
+        _close_chat_history(session_id)
+
+
+atexit.register(flush_chat_history)
+
+
 def save_chat_history(session_id, chat_history):
-    file_path = os.path.join(CHAT_LOGS_DIR, f"{session_id}.json")
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(chat_history, f, ensure_ascii=False, indent=4)
-    print(f"Chat history saved to: {file_path}")
+    log_path, _ = _history_paths(session_id)
+    ensure_data_dirs()
+    with _history_lock:
+        _close_chat_history(session_id)
+        tmp_path = f"{log_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for sender, message in chat_history:
+                f.write(json.dumps([sender, message], ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, log_path)
+        _write_history_index(session_id, _scan_history(log_path, {"count": 0, "latest_summary_offset": None, "size": 0}))
+    log_event("Chat history saved", path=log_path, messages=len(chat_history))
 
 
 def load_chat_history(session_id):
-    file_path = os.path.join(CHAT_LOGS_DIR, f"{session_id}.json")
-    if os.path.exists(file_path):
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+    flush_chat_history(session_id)
+    _migrate_legacy_history(session_id)
+    log_path, _ = _history_paths(session_id)
+    if os.path.exists(log_path):
+        with span("history.read", session_id=session_id), open(log_path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.endswith("\n")]
     return []
 
 
+def count_chat_messages(session_id):
+    with _history_lock:
+        writer = _history_writers.get(session_id)
+        if writer:
+            return writer["index"]["count"]
+    _migrate_legacy_history(session_id)
+    return _load_history_index(session_id)["count"]
+
+
 ### Ollama Integration Utilities ###
-def prepare_ollama_prompt(base_prompt, user_message, conversation_history=None):
+# Prompts are kept within a token budget: recent turns are sent verbatim and older
+# turns are folded into a rolling summary. Folding happens in batches (down to
+# CONTEXT_RECENT_FRACTION of the budget) so the system + summary prefix stays the
+# same for several turns and the model server can reuse its prompt cache.
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+CONTEXT_RECENT_FRACTION = 0.5
+SENDER_ROLES = {"User": "user", "Bot": "assistant"}
+
+
+def _turn_tokens(turn):
+    sender, message = turn
+    return estimate_tokens(f"{sender}: {message}") + 1
+
+
+def window_history(conversation_history, max_tokens):
+    """
+    Returns the most recent turns of a conversation that fit in max_tokens.
+    """
+    window = []
+    used = 0
+    for turn in reversed(conversation_history or []):
+        used += _turn_tokens(turn)
+        if used > max_tokens:
+            break
+        window.append(turn)
+    return window[::-1]
+
+
+def make_history_summarizer(ollama_client):
+    """
+    Builds a summarize(previous_summary, turns) callable for ConversationContext
+    that asks Ollama to fold new turns into the running summary.
+    """
+    def summarize(previous_summary, turns):
+        turns_text = "\n".join(f"{sender}: {message}" for sender, message in turns)
+        prompt = (
+            "Update the running summary of a conversation with the new exchanges below. "
+            "Keep it brief and keep any facts the assistant will need later.\n\n"
+            f"Running summary:\n{previous_summary or '(none)'}\n\nNew exchanges:\n{turns_text}"
+        )
+        return ollama_client.send_prompt(prompt, task="history_summary")
+    return summarize
+
+
+class ConversationContext:
+    """
+    Keeps a conversation's prompt within a token budget and builds native
+    /api/chat message arrays from it.
+
+    Turns that slide out of the window are folded into a rolling summary through
+    the summarize(previous_summary, turns) callable. The summary is updated only
+    with the newly folded turns, never rebuilt from the whole history. Without a
+    summarizer, old turns are simply dropped.
+    """
+
+    def __init__(self, base_prompt, max_tokens=CONTEXT_MAX_TOKENS, summarize=None):
+        self.base_prompt = base_prompt
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.rolling_summary = ""
+        self.folded = 0
+
+    def _history_budget(self, user_message):
+        fixed = estimate_tokens(self.base_prompt) + estimate_tokens(self.rolling_summary) + estimate_tokens(user_message)
+        return max(0, self.max_tokens - fixed)
+
+    def _fold(self, conversation_history, user_message):
+        recent = conversation_history[self.folded:]
+        budget = self._history_budget(user_message)
+        if sum(_turn_tokens(turn) for turn in recent) <= budget:
+            return recent
+        keep = window_history(recent, int(budget * CONTEXT_RECENT_FRACTION))
+        to_fold = recent[:len(recent) - len(keep)]
+        if self.summarize and to_fold:
+            self.rolling_summary = self.summarize(self.rolling_summary, to_fold)
+        self.folded += len(to_fold)
+        # The summary may have grown; make sure what is kept still fits.
+        return window_history(keep, self._history_budget(user_message))
+
+    def build_messages(self, user_message, conversation_history=None):
+        """
+        Builds the message array for /api/chat.
+
+        Args:
+            user_message (str): The user's current input.
+            conversation_history (list): The full list of (sender, message) turns so far.
+
+        Returns:
+            list: Messages with "role" and "content".
+        """
+        conversation_history = list(conversation_history or [])
+        if self.folded > len(conversation_history):
+            # History was cleared or replaced; start folding from scratch.
+            self.rolling_summary = ""
+            self.folded = 0
+        recent = self._fold(conversation_history, user_message)
+
+        system = self.base_prompt
+        if self.rolling_summary:
+            system = f"{system}\n\nSummary of the earlier conversation:\n{self.rolling_summary}"
+        messages = [{"role": "system", "content": system}]
+        for sender, message in recent:
+            messages.append({"role": SENDER_ROLES.get(sender, "user"), "content": message})
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+
+# Sessions whose rolling context is kept in memory; the least recently used one is
+# dropped first, and its summary is folded again from the history if it returns.
+CONTEXT_SESSIONS = int(os.getenv("CONTEXT_SESSIONS", "256"))
+
+_conversation_lock = threading.Lock()
+_conversation_contexts = OrderedDict()
+
+
+def get_conversation_context(session_id, base_prompt, summarize=None, max_tokens=CONTEXT_MAX_TOKENS):
+    """
+    Returns the cached ConversationContext for a session, so its rolling summary
+    carries over between turns.
+    """
+    with _conversation_lock:
+        context = _conversation_contexts.get(session_id)
+        if context is None or context.base_prompt != base_prompt:
+            context = ConversationContext(base_prompt, max_tokens, summarize)
+            _conversation_contexts[session_id] = context
+            while len(_conversation_contexts) > max(CONTEXT_SESSIONS, 1):
+                _conversation_contexts.popitem(last=False)
+        elif summarize is not None:
+            context.summarize = summarize
+        _conversation_contexts.move_to_end(session_id)
+        return context
+
+
+def prepare_ollama_messages(session_id, base_prompt, user_message, conversation_history=None, summarize=None):
+    """
+    Builds a token-budgeted /api/chat message array for a session's next turn.
+
+    Args:
+        session_id (str): Unique ID for the session.
+        base_prompt (str): The system prompt for the chat.
+        user_message (str): The user's current input.
+        conversation_history (list): Optional list of previous exchanges.
+        summarize: Optional summarize(previous_summary, turns) callable, see
+            make_history_summarizer.
+
+    Returns:
+        list: Messages ready for OllamaIntegration.send_messages.
+    """
+    with span("prompt.build", session_id=session_id, kind="messages") as current:
+        context = get_conversation_context(session_id, base_prompt, summarize)
+        messages = context.build_messages(user_message, conversation_history)
+        current.set_tag(messages=len(messages), tokens=sum(estimate_tokens(message["content"]) for message in messages))
+        return messages
+
+
+def prepare_ollama_prompt(base_prompt, user_message, conversation_history=None, max_tokens=CONTEXT_MAX_TOKENS):
     """
     Constructs the full prompt for the Ollama API.
 
@@ -110,18 +450,21 @@ def prepare_ollama_prompt(base_prompt, user_message, conversation_history=None):
         base_prompt (str): The initial system prompt for the chat.
         user_message (str): The user's current input.
         conversation_history (list): Optional list of previous exchanges.
+        max_tokens (int): Token budget; only the most recent turns that fit are kept.
 
     Returns:
         str: Complete prompt including history and user input.
     """
-    print("Preparing Ollama prompt...")
-    if not conversation_history:
-        conversation_history = []
-    
-    conversation_text = "\n".join([f"{sender}: {message}" for sender, message in conversation_history])
-    complete_prompt = f"{base_prompt}\n{conversation_text}\nUser: {user_message}\nBot:"
-    print(f"Prepared prompt: {complete_prompt[:100]}...")  # Truncated for debugging
-    return complete_prompt
+    with span("prompt.build", kind="prompt") as current:
+        if not conversation_history:
+            conversation_history = []
+
+        history_budget = max_tokens - estimate_tokens(base_prompt) - estimate_tokens(user_message)
+        conversation_history = window_history(conversation_history, history_budget)
+        conversation_text = "\n".join([f"{sender}: {message}" for sender, message in conversation_history])
+        complete_prompt = f"{base_prompt}\n{conversation_text}\nUser: {user_message}\nBot:"
+        current.set_tag(turns=len(conversation_history), tokens=estimate_tokens(complete_prompt))
+        return complete_prompt
 
 
 def save_ollama_response(session_id, user_message, bot_response):
@@ -133,11 +476,7 @@ def save_ollama_response(session_id, user_message, bot_response):
         user_message (str): The user's message.
         bot_response (str): The bot's response.
     """
-    print(f"Saving Ollama response for session {session_id}...")
-    chat_history = load_chat_history(session_id)
-    chat_history.append(("User", user_message))
-    chat_history.append(("Bot", bot_response))
-    save_chat_history(session_id, chat_history)
+    append_chat_messages(session_id, [("User", user_message), ("Bot", bot_response)])
 
 
 def retrieve_summary(session_id):
@@ -150,17 +489,24 @@ def retrieve_summary(session_id):
     Returns:
         str: The latest summary if available.
     """
-    print(f"Retrieving summary for session {session_id}...")
-    chat_history = load_chat_history(session_id)
-    summaries = [msg for sender, msg in chat_history if sender == "Bot" and "Summary:" in msg]
-    return summaries[-1] if summaries else "No summary available."
+    flush_chat_history(session_id)
+    _migrate_legacy_history(session_id)
+    index = _load_history_index(session_id)
+    if index["latest_summary_offset"] is None:
+        return "No summary available."
+    log_path, _ = _history_paths(session_id)
+    with span("history.read", session_id=session_id, kind="summary"), open(log_path, "rb") as f:
+        f.seek(index["latest_summary_offset"])
+        return json.loads(f.readline())[1]
 
 
 ### Temporary File Management ###
 def clear_temp_files():
-    for file in os.listdir(TEMP_DIR):
-        file_path = os.path.join(TEMP_DIR, file)
-        os.remove(file_path)
-        print(f"Removed temp file: {file_path}")
+    ensure_data_dirs()
+    with os.scandir(TEMP_DIR) as it:
+        for entry in it:
+            if entry.is_file(follow_symlinks=False):
+                os.remove(entry.path)
+                log_event("Removed temp file", path=entry.path)
 
 
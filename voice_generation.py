@@ -1,29 +1,142 @@
 # Developer: Eric Neftali Paiz
-from elevenlabs.client import ElevenLabs
 import os
+import hashlib
+import json
+import logging
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from instrumentation import bind, log_event, metrics, span
+from storage_janitor import data_dir, ensure_data_dirs, notify_access, notify_write
+from text_chunking import split_pieces
 
 # Directory for saving generated audio files
-AUDIO_OUTPUT_DIR = "data/audio"
-os.makedirs(AUDIO_OUTPUT_DIR, exist_ok=True)
+AUDIO_OUTPUT_DIR = data_dir("data/audio")
 
-def get_voices(client):
+# Voice catalogs are cached per API key for the life of the process, so resolving a
+# voice name costs no network round trip once the catalog has been fetched.
+VOICE_CACHE_TTL = float(os.getenv("VOICE_CACHE_TTL", "3600"))
+_voice_catalogs = {}
+_catalog_refreshes = {}
+_catalog_lock = threading.Lock()
+
+
+def _check_client(client):
+    # The SDK is imported on first use; loading it takes most of a cold start.
+    from elevenlabs.client import ElevenLabs
+    if not isinstance(client, ElevenLabs):
+        raise TypeError("Invalid client. Please provide a valid ElevenLabs client instance.")
+
+
+def _catalog_key(client):
+    try:
+        return client._client_wrapper.get_headers().get("xi-api-key") or id(client)
+    except AttributeError:
+        return id(client)
+
+
+def _fetch_voice_catalog(client):
+    try:
+        with span("voice.catalog_refresh"):
+            response = client.voices.get_all()
+    except Exception as e:
+        raise RuntimeError(f"Failed to fetch voices: {e}")
+    voices = [{"Name": voice.name, "ID": voice.voice_id} for voice in response.voices]
+    return {
+        "voices": voices,
+        "by_name": {voice["Name"]: voice["ID"] for voice in voices},
+        "fetched_at": time.monotonic(),
+    }
+
+
+def refresh_voice_catalog(client):
     """
-    Fetches available voices from ElevenLabs.
+    Fetches the voice catalog for the client's account and replaces the cached copy.
+
+    Concurrent refreshes for the same account share a single request: the first
+    caller fetches and the others wait for its result.
 
     Args:
         client: ElevenLabs client instance.
 
     Returns:
-        list: A list of dictionaries with voice names and IDs.
+        dict: The catalog, with "voices" (list) and "by_name" (name -> voice ID).
     """
-    if not isinstance(client, ElevenLabs):
-        raise TypeError("Invalid client. Please provide a valid ElevenLabs client instance.")
+    key = _catalog_key(client)
+    with _catalog_lock:
+        pending = _catalog_refreshes.get(key)
+        if pending is None:
+            pending = {"done": threading.Event(), "catalog": None, "error": None}
+            _catalog_refreshes[key] = pending
+            owner = True
+        else:
+            owner = False
+
+    if not owner:
+        pending["done"].wait()
+        if pending["error"]:
+            raise pending["error"]
+        return pending["catalog"]
 
     try:
-        response = client.voices.get_all()
-        return [{"Name": voice.name, "ID": voice.voice_id} for voice in response.voices]
+        pending["catalog"] = _fetch_voice_catalog(client)
+        with _catalog_lock:
+            _voice_catalogs[key] = pending["catalog"]
+        return pending["catalog"]
     except Exception as e:
-        raise RuntimeError(f"Failed to fetch voices: {e}")
+        pending["error"] = e
+        raise
+    finally:
+        with _catalog_lock:
+            _catalog_refreshes.pop(key, None)
+        pending["done"].set()
+
+
+def get_voice_catalog(client, refresh=False):
+    _check_client(client)
+
+    catalog = _voice_catalogs.get(_catalog_key(client))
+    if refresh or catalog is None or time.monotonic() - catalog["fetched_at"] > VOICE_CACHE_TTL:
+        catalog = refresh_voice_catalog(client)
+    return catalog
+
+
+def invalidate_voice_catalog(client=None):
+    with _catalog_lock:
+        if client is None:
+            _voice_catalogs.clear()
+        else:
+            _voice_catalogs.pop(_catalog_key(client), None)
+
+
+def get_voices(client, refresh=False):
+    """
+    Fetches available voices from ElevenLabs.
+
+    Args:
+        client: ElevenLabs client instance.
+        refresh: Bypass the cached catalog and fetch it again.
+
+    Returns:
+        list: A list of dictionaries with voice names and IDs.
+    """
+    return get_voice_catalog(client, refresh)["voices"]
+
+
+def get_voice_id(client, voice_name):
+    """
+    Resolves a voice name to its voice ID from the cached catalog.
+
+    Returns:
+        str | None: The voice ID, or None if the account has no voice by that name.
+    """
+    with span("voice.lookup", voice=voice_name) as current:
+        voice_id = get_voice_catalog(client)["by_name"].get(voice_name)
+        current.set_tag(found=voice_id is not None)
+        return voice_id
 
 def generate_speech(client, text, voice_name, save_as=None):
     """
@@ -38,31 +151,378 @@ def generate_speech(client, text, voice_name, save_as=None):
     Returns:
         bytes: Generated audio content.
     """
-    if not isinstance(client, ElevenLabs):
-        raise TypeError("Invalid client. Please provide a valid ElevenLabs client instance.")
+    _check_client(client)
 
     if not text.strip():
         raise ValueError("Input text cannot be empty.")
 
-    voices = get_voices(client)
-    voice_id = next((voice["ID"] for voice in voices if voice["Name"] == voice_name), None)
+    voice_id = get_voice_id(client, voice_name)
 
     if not voice_id:
         raise ValueError(f"Voice '{voice_name}' not found.")
 
     try:
-        audio = client.generate(
-            text=text,
-            voice=voice_id,
-            model="eleven_turbo_v2"
-        )
+        with span("tts.generate", voice=voice_name, chars=len(text)):
+            audio = client.generate(
+                text=text,
+                voice=voice_id,
+                model="eleven_turbo_v2"
+            )
 
         if save_as:
+            ensure_data_dirs()
             save_path = os.path.join(AUDIO_OUTPUT_DIR, save_as)
-            with open(save_path, "wb") as audio_file:
+            with span("file.write", path=save_path), open(save_path, "wb") as audio_file:
                 audio_file.write(audio)
-            print(f"Audio saved as: {save_path}")
+            log_event("Audio saved", path=save_path)
 
         return audio
     except Exception as e:
         raise RuntimeError(f"Failed to generate speech: {e}")
+
+
+### Document Synthesis ###
+# Long text is voiced as independent segments so no single request hits the API's
+# size limit and segments can be synthesized side by side.
+TTS_SEGMENT_CHARS = int(os.getenv("TTS_SEGMENT_CHARS", "2500"))
+TTS_MAX_PARALLEL = int(os.getenv("TTS_MAX_PARALLEL", "3"))
+
+
+def split_for_speech(text, max_chars=TTS_SEGMENT_CHARS):
+    """
+    Splits text into speech segments at paragraph or sentence boundaries.
+
+    As in ollama_integration.group_pages, boundaries depend on content: a segment
+    ends after any piece (a paragraph, or a sentence of an over-long one) whose
+    hash falls below a threshold proportional to the piece's length, which makes
+    segments about max_chars / 2 long on average, and before any piece that would
+    take it over max_chars. An edit only moves boundaries up to the next hash
+    boundary; later segments keep their text, and so their cached audio.
+
+    Args:
+        text: The text to split.
+        max_chars: Character budget per segment.
+
+    Returns:
+        list: Segments in reading order.
+    """
+    target = max(1, max_chars // 2)
+    segments, current, current_len = [], [], 0
+
+    def close():
+        nonlocal current, current_len
+        if current:
+            segments.append("\n\n".join(current))
+        current, current_len = [], 0
+
+    for piece in split_pieces(text, max_chars):
+        if current and current_len + 2 + len(piece) > max_chars:
+            close()
+        current_len += len(piece) + (2 if current else 0)
+        current.append(piece)
+        piece_hash = hashlib.sha256(normalize_speech_text(piece).encode("utf-8")).hexdigest()
+        if int(piece_hash[:8], 16) % target < len(piece):
+            close()
+    close()
+    return segments
+
+
+### Audio Cache ###
+# Synthesized audio is kept on disk keyed by what determines the sound: normalized
+# text, voice, model and voice settings. Least recently used entries are evicted
+# once the cache grows past TTS_CACHE_MAX_BYTES.
+TTS_MODEL = "eleven_turbo_v2"
+TTS_CACHE_DIR = data_dir(os.path.join(AUDIO_OUTPUT_DIR, "cache"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+_audio_cache_index = None
+_audio_cache_bytes = 0
+_audio_cache_lock = threading.Lock()
+
+
+def normalize_speech_text(text):
+    return " ".join(text.split())
+
+
+def _settings_fingerprint(settings):
+    if settings is None:
+        return None
+    if hasattr(settings, "model_dump"):
+        return settings.model_dump()
+    if hasattr(settings, "dict"):
+        return settings.dict()
+    return settings
+
+
+def audio_cache_key(text, voice_id, model=TTS_MODEL, settings=None):
+    """
+    Builds the cache key for a piece of synthesized audio.
+
+    Args:
+        text: Text that was voiced. Whitespace differences do not change the key.
+        voice_id: ElevenLabs voice ID.
+        model: TTS model name.
+        settings: Optional VoiceSettings (or dict) used for synthesis.
+
+    Returns:
+        str: Hex SHA-256 key.
+    """
+    fingerprint = json.dumps(
+        [normalize_speech_text(text), voice_id, model, _settings_fingerprint(settings)],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+
+def _load_audio_cache_index():
+    """Builds the LRU index from disk once; afterwards it is kept up to date in memory."""
+    global _audio_cache_index, _audio_cache_bytes
+    if _audio_cache_index is None:
+        ensure_data_dirs()
+        entries = []
+        with os.scandir(TTS_CACHE_DIR) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".mp3"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        _audio_cache_index = OrderedDict((key, size) for _, key, size in sorted(entries))
+        _audio_cache_bytes = sum(_audio_cache_index.values())
+    return _audio_cache_index
+
+
+def _audio_cache_path(key):
+    return os.path.join(TTS_CACHE_DIR, f"{key}.mp3")
+
+
+def cached_audio_path(key):
+    """
+    Returns the path of cached audio for a key and marks it as recently used,
+    or None on a miss.
+    """
+    path = _audio_cache_path(key)
+    with _audio_cache_lock:
+        index = _load_audio_cache_index()
+        if key not in index:
+            return None
+        index.move_to_end(key)
+    try:
+        os.utime(path)
+        notify_access(path)
+        return path
+    except FileNotFoundError:
+        with _audio_cache_lock:
+            _forget_cached_audio(key)
+        return None
+
+
+def _forget_cached_audio(key):
+    global _audio_cache_bytes
+    size = _audio_cache_index.pop(key, None)
+    if size is not None:
+        _audio_cache_bytes -= size
+
+
+def save_cached_audio_file(key, source_path):
+    """
+    Copies an audio file into the cache under a key, evicting least recently used
+    entries past the size limit.
+    """
+    global _audio_cache_bytes
+    ensure_data_dirs()
+    path = _audio_cache_path(key)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    shutil.copyfile(source_path, tmp_path)
+    os.replace(tmp_path, path)
+    notify_write(path)
+    size = os.path.getsize(path)
+    with _audio_cache_lock:
+        index = _load_audio_cache_index()
+        _forget_cached_audio(key)
+        index[key] = size
+        _audio_cache_bytes += size
+        while _audio_cache_bytes > TTS_CACHE_MAX_BYTES and len(index) > 1:
+            evicted, evicted_size = index.popitem(last=False)
+            _audio_cache_bytes -= evicted_size
+            try:
+                os.remove(_audio_cache_path(evicted))
+            except FileNotFoundError:
+                pass
+
+
+### Audio Spooling ###
+# Audio goes from the API to disk chunk by chunk and is read back the same way,
+# so memory use does not grow with the length of the document.
+# Kept out of data/temp, whose files util.clear_temp_files deletes wholesale.
+SPOOL_DIR = data_dir(os.path.join("data", "spool"))
+SPOOL_CHUNK_BYTES = 64 * 1024
+
+
+def write_audio_stream(chunks, path):
+    """
+    Writes audio chunks to a file as they arrive from the generator.
+
+    Args:
+        chunks: Iterable of bytes (or a single bytes object).
+        path: Destination file.
+
+    Returns:
+        int: Number of bytes written.
+    """
+    if isinstance(chunks, bytes):
+        chunks = [chunks]
+    written = 0
+    with open(path, "wb") as f:
+        for chunk in chunks:
+            if chunk:
+                f.write(chunk)
+                written += len(chunk)
+    notify_write(path)
+    return written
+
+
+def iter_audio_file(path, chunk_size=SPOOL_CHUNK_BYTES):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def new_spool_path(suffix=".mp3"):
+    ensure_data_dirs()
+    handle, path = tempfile.mkstemp(suffix=suffix, dir=SPOOL_DIR)
+    os.close(handle)
+    return path
+
+
+def synthesize_segment(client, text, voice_id, path, settings=None):
+    """
+    Synthesizes one segment straight into a file, copying it from the audio cache
+    when the same text was already voiced with the same voice and settings.
+
+    Returns:
+        str: The path the audio was written to.
+    """
+    key = audio_cache_key(text, voice_id, TTS_MODEL, settings)
+    with span("tts.segment", chars=len(text)) as current:
+        cached_path = cached_audio_path(key)
+        current.set_tag(cached=cached_path is not None)
+        metrics.inc("thoughtscribe_tts_cache_total", result="hit" if cached_path is not None else "miss")
+        if cached_path is not None:
+            shutil.copyfile(cached_path, path)
+            return path
+
+        from elevenlabs import Voice
+        audio = client.generate(
+            text=text,
+            voice=Voice(voice_id=voice_id, settings=settings) if settings else voice_id,
+            model=TTS_MODEL
+        )
+        write_audio_stream(audio, path)
+        save_cached_audio_file(key, path)
+        return path
+
+
+class SpeechSynthesis:
+    """
+    Synthesizes a list of text segments concurrently and stitches the audio back
+    together in order. Each segment is spooled to its own file, and segments that
+    fail keep their error so they can be retried with another call to run()
+    without redoing the ones that succeeded.
+    """
+
+    def __init__(self, client, segments, voice_name, max_parallel=TTS_MAX_PARALLEL, settings=None):
+        _check_client(client)
+        segments = [segment for segment in segments if segment.strip()]
+        if not segments:
+            raise ValueError("Input text cannot be empty.")
+
+        self.voice_id = get_voice_id(client, voice_name)
+        if not self.voice_id:
+            raise ValueError(f"Voice '{voice_name}' not found.")
+
+        self.client = client
+        self.segments = segments
+        self.max_parallel = max_parallel
+        self.settings = settings
+        ensure_data_dirs()
+        self.spool_dir = tempfile.mkdtemp(dir=SPOOL_DIR)
+        self.segment_files = [None] * len(segments)
+        self.errors = {}
+
+    @property
+    def completed(self):
+        return sum(1 for path in self.segment_files if path is not None)
+
+    @property
+    def is_complete(self):
+        return self.completed == len(self.segments)
+
+    def _synthesize(self, index):
+        path = os.path.join(self.spool_dir, f"segment_{index:05d}.mp3")
+        return synthesize_segment(self.client, self.segments[index], self.voice_id, path, self.settings)
+
+    def run(self, progress_callback=None):
+        """
+        Synthesizes every segment that has no audio yet.
+
+        Args:
+            progress_callback: Optional callable(completed, total) called as segments
+                finish. If it raises, segments that have not started are dropped and
+                the exception propagates; finished segments are kept.
+
+        Returns:
+            bool: True if every segment now has audio.
+        """
+        pending = [index for index, path in enumerate(self.segment_files) if path is None]
+        self.errors = {}
+        with span("tts.synthesize", segments=len(pending), total_segments=len(self.segments)) as current:
+            self._run_pending(pending, progress_callback)
+            current.set_tag(failed=len(self.errors))
+        return self.is_complete
+
+    def _run_pending(self, pending, progress_callback):
+        pool = ThreadPoolExecutor(max_workers=self.max_parallel)
+        try:
+            futures = {pool.submit(bind(self._synthesize), index): index for index in pending}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    self.segment_files[index] = future.result()
+                except Exception as e:
+                    self.errors[index] = e
+                    log_event("Segment failed", logging.WARNING, segment=index, error=str(e))
+                if progress_callback:
+                    progress_callback(self.completed, len(self.segments))
+        except BaseException:
+            pool.shutdown(cancel_futures=True)
+            raise
+        finally:
+            pool.shutdown()
+
+    def iter_audio(self):
+        """
+        Yields the stitched audio in chunks, in segment order, stopping at the first
+        segment that has not been synthesized yet.
+        """
+        for path in self.segment_files:
+            if path is None:
+                return
+            yield from iter_audio_file(path)
+
+    def write_to(self, path):
+        """
+        Writes the complete audio to a file without loading it into memory.
+
+        Returns:
+            str: The path written.
+        """
+        if not self.is_complete:
+            raise RuntimeError(f"Failed to generate speech for {len(self.errors)} segment(s).")
+        write_audio_stream(self.iter_audio(), path)
+        return path
+
+    def cleanup(self):
+        shutil.rmtree(self.spool_dir, ignore_errors=True)